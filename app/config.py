@@ -1,3 +1,5 @@
+from typing import Dict
+
 from pydantic import BaseSettings
 
 """
@@ -8,6 +10,83 @@ class Settings(BaseSettings):
     database_port: int
     database_name: str
 
+    # Connection pool
+    database_max_pool_size: int = 100
+    database_min_pool_size: int = 10
+    database_wait_queue_timeout_ms: int = 2000
+    database_server_selection_timeout_ms: int = 5000
+    database_compressors: str = ""
+
+    # Request deadlines, applied to the Mongo calls of a read request as maxTimeMS, 0 disables them
+    request_timeout_ms: int = 10000
+    max_request_timeout_ms: int = 60000
+    route_timeouts_ms: Dict[str, int] = {}
+
+    # Admission control, concurrent and queued requests per route class, kept below database_max_pool_size
+    admission_enabled: bool = True
+    admission_read_concurrency: int = 48
+    admission_read_queue: int = 96
+    admission_write_concurrency: int = 24
+    admission_write_queue: int = 48
+    admission_list_concurrency: int = 16
+    admission_list_queue: int = 16
+    admission_queue_timeout_ms: int = 1000
+    admission_retry_after_seconds: int = 1
+
+    # Read routing, read preference of the list and lookup endpoints, e.g. secondaryPreferred
+    database_read_preference: str = "primary"
+
+    # Write coalescing of create_user, inserts are batched for up to the window or max documents
+    insert_coalescing_enabled: bool = False
+    insert_coalescing_window_ms: int = 2
+    insert_coalescing_max_docs: int = 100
+
+    # Pagination
+    max_page_limit: int = 100
+    max_page_offset: int = 10000
+
+    # Total counts of filtered lists
+    count_cache_ttl_seconds: float = 30
+    count_cache_max_size: int = 1024
+    count_estimate_limit: int = 1000
+
+    # Batch endpoints
+    max_batch_size: int = 1000
+
+    # NDJSON user import
+    import_batch_size: int = 1000
+    import_max_line_bytes: int = 65536
+    import_max_reported_errors: int = 1000
+
+    # Organization deletion, larger organizations are cleaned up in the background
+    delete_inline_max_members: int = 10000
+    delete_batch_size: int = 1000
+
+    # Streaming exports
+    export_batch_size: int = 1000
+    export_max_batch_size: int = 10000
+
+    # In-process read-through cache of single users and organizations
+    cache_enabled: bool = False
+    cache_max_size: int = 10000
+    cache_ttl_seconds: float = 60
+
+    # Cache invalidation from a change stream, and the cache TTL while the stream is down
+    cache_invalidation_enabled: bool = True
+    cache_fallback_ttl_seconds: float = 1
+    cache_invalidation_retry_seconds: float = 5
+
+    # Largest number of related documents returned per expanded relation (expand=)
+    max_expand_size: int = 100
+
+    # Slow-query profiler, explaining the Mongo commands slower than the threshold
+    profiler_enabled: bool = False
+    profiler_threshold_ms: float = 100
+    profiler_max_entries: int = 50
+
+    # Serialize responses straight from the Mongo documents, skipping the response_model validation
+    fast_serialization: bool = False
+
     class Config:
         env_file = ".env"
 
@@ -1,33 +1,137 @@
-from .config import settings
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+
+from fastapi import HTTPException, Header, Depends, status
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from pymongo.errors import ConnectionFailure
 
+from .config import settings
+from .lib.migrations import MigrationsPending, check_migrations
+from .lib.metrics import command_metrics
+from .lib.profiler import slow_queries
+from .lib.consistency import READ_PREFERENCES, CausalClock, CausalDatabase
+
 """Environment Variables"""
 DATABASE_HOSTNAME = settings.database_hostname
 DATABASE_PORT = settings.database_port
 DATABASE_NAME = settings.database_name
 
 """
-Connect to MongoDB server and return database object
+Client and database, created once at startup and closed at shutdown
 """
+client = None
 db = None
 
+"""
+Options of the connection pool, from the settings, and the command listeners feeding the metrics and the slow-query profiler
+"""
+def client_options() -> dict:
+    options = {
+        "maxPoolSize": settings.database_max_pool_size,
+        "minPoolSize": settings.database_min_pool_size,
+        "waitQueueTimeoutMS": settings.database_wait_queue_timeout_ms,
+        "serverSelectionTimeoutMS": settings.database_server_selection_timeout_ms,
+        "event_listeners": [command_metrics, slow_queries]
+    }
+    if settings.database_compressors:
+        options["compressors"] = settings.database_compressors
+    return options
+
+"""
+Open minPoolSize connections up front with concurrent pings, so that the first requests do not pay for the handshakes
+"""
+async def warm_up_pool(client: AsyncIOMotorClient):
+    await asyncio.gather(*[client.admin.command("ping") for _ in range(max(settings.database_min_pool_size, 1))])
+
+"""
+    Connect to MongoDB server and return database object.
+    Called once from the startup hook, a failure to reach the server aborts the startup.
+
+    Indexes and backfills are applied by python -m app.migrate, the startup only checks that the
+    database is at the latest migration.
+
+    Raises:
+        ConnectionFailure: MongoDB server is not reachable
+        MigrationsPending: The database is behind the migrations of the code
+"""
 async def connect_to_db():
-    global db
+    global client, db
     if db is not None:
         return db
     try:
-        client = AsyncIOMotorClient(DATABASE_HOSTNAME, DATABASE_PORT)
-        db = client[DATABASE_NAME]
+        client = AsyncIOMotorClient(DATABASE_HOSTNAME, DATABASE_PORT, **client_options())
+        slow_queries.attach(asyncio.get_running_loop(), client)
+        await warm_up_pool(client)
+        database = client[DATABASE_NAME]
         
-        # Create unique index on email
-        await db.users.create_index("email", unique=True)
-        # Create unique index on name
-        await db.organizations.create_index("name", unique=True)
-        await db.organizations.create_index("created_by", unique=True)
+        # Readiness check, a single read of the migration version
+        await check_migrations(database)
         
+        db = database
         print(f"Connected to MongoDB server at {DATABASE_HOSTNAME}:{DATABASE_PORT}")
         return db
     except ConnectionFailure:
         print(f"Error connecting to MongoDB server at {DATABASE_HOSTNAME}:{DATABASE_PORT}")
-        return None
\ No newline at end of file
+        await close_db_connection()
+        raise
+    except MigrationsPending as error:
+        print(f"Error starting with MongoDB server at {DATABASE_HOSTNAME}:{DATABASE_PORT}: {error}")
+        await close_db_connection()
+        raise
+
+"""
+Close the client and its connection pool, called from the shutdown hook
+"""
+async def close_db_connection():
+    global client, db
+    if client is not None:
+        client.close()
+        print(f"Disconnected from MongoDB server at {DATABASE_HOSTNAME}:{DATABASE_PORT}")
+    client, db = None, None
+
+"""
+Whether the database is connected, for the health check
+"""
+def db_is_available() -> bool:
+    return db is not None
+
+"""
+    Dependency providing the database to the route handlers.
+    Tests and benchmarks can replace it through app.dependency_overrides[get_database].
+
+    Raises:
+        HTTPException: Database not connected error
+"""
+async def get_database() -> AsyncIOMotorDatabase:
+    if db is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is not available."
+        )
+    return db
+
+"""
+    Dependency providing the database to the list and lookup handlers, routed with the configured read preference.
+
+    With a secondary read preference, or when the client sends the X-Causal-Token of one of its writes,
+    the reads run in causally consistent sessions, so that they still see the writes of the token.
+
+    Raises:
+        HTTPException: Database not connected error
+        HTTPException: Invalid causal token error
+"""
+async def get_read_database(x_causal_token: str = Header(None), db: AsyncIOMotorDatabase = Depends(get_database)):
+    read_preference = READ_PREFERENCES[settings.database_read_preference]
+    if read_preference == READ_PREFERENCES["primary"] and not x_causal_token:
+        return db
+    return CausalDatabase(db.with_options(read_preference=read_preference), CausalClock.from_token(db.client, x_causal_token))
+
+"""
+    Dependency providing the database to the write handlers, whose operations run in causally consistent
+    sessions so that the handler can return the X-Causal-Token of its writes with set_causal_token.
+
+    Raises:
+        HTTPException: Database not connected error
+        HTTPException: Invalid causal token error
+"""
+async def get_write_database(x_causal_token: str = Header(None), db: AsyncIOMotorDatabase = Depends(get_database)):
+    return CausalDatabase(db, CausalClock.from_token(db.client, x_causal_token))
@@ -0,0 +1,154 @@
+import asyncio
+import collections
+import json
+from typing import Optional
+
+from .. config import settings
+from . metrics import registry, route_template
+
+"""
+GET routes that scan, search or stream a collection, admitted as the list class
+"""
+LIST_ROUTES = {
+    "/users/",
+    "/users/export",
+    "/organizations/",
+    "/organizations/export",
+    "/organizations/{organization_id}/members"
+}
+
+"""
+POST routes that only read, admitted as the read class
+"""
+READ_ROUTES = {
+    "/users/lookup",
+    "/organizations/lookup"
+}
+
+"""
+Routes that are never queued nor shed, so that health checks and metrics keep answering under load
+"""
+EXEMPT_ROUTES = {"/", "/health", "/metrics", "/admin/slow-queries", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json", "unmatched"}
+
+"""
+Route class of a request, or None when it is exempt from admission control
+"""
+def route_class(method: str, route: str) -> Optional[str]:
+    if route in EXEMPT_ROUTES:
+        return None
+    if method == "GET":
+        return "list" if route in LIST_ROUTES else "read"
+    if route in READ_ROUTES:
+        return "read"
+    return "write"
+
+"""
+    Concurrency limit of a route class with a bounded FIFO wait queue.
+
+    A request is admitted right away while fewer than max_concurrency are running, otherwise it waits
+    in the queue for at most queue_timeout seconds. When the queue is full it is rejected at once.
+"""
+class AdmissionLimiter:
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters = collections.deque()
+
+    """
+    Admit a request, returning None once it holds a slot or the reason of its rejection: "queue_full" or "queue_timeout"
+    """
+    async def acquire(self) -> Optional[str]:
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            return None
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait timed out
+                return None
+            waiter.cancel()
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    """
+    Release a slot, handing it over to the first request still waiting
+    """
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+limiters = {
+    "read": AdmissionLimiter("read", settings.admission_read_concurrency, settings.admission_read_queue, settings.admission_queue_timeout_ms / 1000),
+    "write": AdmissionLimiter("write", settings.admission_write_concurrency, settings.admission_write_queue, settings.admission_queue_timeout_ms / 1000),
+    "list": AdmissionLimiter("list", settings.admission_list_concurrency, settings.admission_list_queue, settings.admission_queue_timeout_ms / 1000)
+}
+
+"""
+    ASGI middleware limiting the concurrent requests of each route class in front of the Mongo pool.
+
+    Requests beyond the limits wait in a bounded queue, and are shed with 429 when the queue is full
+    or 503 when their wait times out, both with Retry-After. Exempt routes bypass the limits.
+"""
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.admission_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        name = route_class(scope["method"], route_template(scope))
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = limiters[name]
+        rejection = await limiter.acquire()
+        if rejection is not None:
+            registry.inc("admission_rejected_total", (name, rejection))
+            await self.reject(send, 429 if rejection == "queue_full" else 503)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+    async def reject(self, send, status_code: int):
+        body = json.dumps({"detail": "The server is overloaded, retry later."}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", str(settings.admission_retry_after_seconds).encode("ascii"))
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,145 @@
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from .. config import settings
+
+"""
+    Bounded LRU cache of documents with a TTL, keyed by _id with secondary keys on unique fields.
+
+    Entries are looked up by ("_id", value) or by (field, value) for one of the alias fields, so a
+    user can be found by id or by email, and an organization by id or by name. Cached documents are
+    shared between requests and must not be mutated.
+"""
+class ReadThroughCache:
+    def __init__(self, name: str, alias_fields: Iterable[str], max_size: int, ttl_seconds: float, enabled: bool = True):
+        self.name = name
+        self.alias_fields = tuple(alias_fields)
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._aliases = {}
+        # Bumped by every write to the cache, so that a load racing with a write is not cached
+        self._generation = 0
+
+    def _aliases_of(self, document: dict) -> list:
+        return [(field, document[field]) for field in self.alias_fields if field in document]
+
+    def _remove(self, _id):
+        entry = self._entries.pop(_id, None)
+        if entry is None:
+            return
+        for alias in self._aliases_of(entry[1]):
+            if self._aliases.get(alias) == _id:
+                del self._aliases[alias]
+
+    def get(self, field: str, value) -> Optional[dict]:
+        _id = value if field == "_id" else self._aliases.get((field, value))
+        entry = self._entries.get(_id)
+        if entry is None:
+            return None
+
+        expires_at, document = entry
+        if expires_at < time.monotonic():
+            self._remove(_id)
+            return None
+
+        self._entries.move_to_end(_id)
+        return document
+
+    """
+    Cache the document written by a request, which supersedes any load still in flight
+    """
+    def set(self, document: dict):
+        self._generation += 1
+        self._store(document)
+
+    def _store(self, document: dict):
+        if not self.enabled or document is None:
+            return
+
+        _id = document["_id"]
+        self._remove(_id)
+        self._entries[_id] = (time.monotonic() + self.ttl_seconds, document)
+        for alias in self._aliases_of(document):
+            self._aliases[alias] = _id
+
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, *ids):
+        self._generation += 1
+        for _id in ids:
+            self._remove(_id)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._aliases.clear()
+
+    """
+    Get a document from the cache, or load it with the given coroutine function and cache it.
+    Misses are not cached, a document that does not exist is loaded again on the next lookup.
+    """
+    async def get_or_load(self, field: str, value, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        if not self.enabled:
+            return await loader()
+
+        document = self.get(field, value)
+        if document is not None:
+            self.hits += 1
+            return document
+
+        self.misses += 1
+        generation = self._generation
+        document = await loader()
+        if generation == self._generation:
+            self._store(document)
+        return document
+
+    """
+    Get many documents from the cache by the same field, and load the missing ones with a single call of
+    the given coroutine function, which receives the missing values and returns the documents found.
+    """
+    async def get_many_or_load(self, field: str, values: List, loader: Callable[[List], Awaitable[List[dict]]]) -> Dict:
+        documents, missing = {}, []
+        for value in values:
+            document = self.get(field, value) if self.enabled else None
+            if document is None:
+                missing.append(value)
+            else:
+                documents[value] = document
+
+        if self.enabled:
+            self.hits += len(documents)
+            self.misses += len(missing)
+        if not missing:
+            return documents
+
+        generation = self._generation
+        loaded = await loader(missing)
+        fresh = generation == self._generation
+        for document in loaded:
+            documents[document[field]] = document
+            if fresh:
+                self._store(document)
+        return documents
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+user_cache = ReadThroughCache("users", ["email"], settings.cache_max_size, settings.cache_ttl_seconds, settings.cache_enabled)
+organization_cache = ReadThroughCache("organizations", ["name"], settings.cache_max_size, settings.cache_ttl_seconds, settings.cache_enabled)
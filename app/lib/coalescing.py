@@ -0,0 +1,131 @@
+import asyncio
+import contextvars
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError, WriteError
+
+from .. config import settings
+from . consistency import CausalClock, CausalCollection
+from . counters import increment_total
+
+"""
+    Coalesce concurrent single-document inserts into unordered insert_many calls.
+
+    Inserts into a collection are collected until window_ms has passed since the first one or
+    max_docs are pending, then written with a single insert_many. Each caller gets the outcome of
+    its own document: nothing once it is inserted (its _id is set on the document), the
+    DuplicateKeyError or WriteError of its document, or the error that failed the whole batch.
+
+    The batch is written in its own task, outside of the deadline of the request that opened it, so
+    a caller that is cancelled does not fail the others (its document is still inserted). When
+    disabled, every insert is a plain insert_one.
+
+    The list counter is incremented by the number of inserted documents once they are written. Its
+    failure is logged and counted, but does not fail the inserts, which are already written.
+"""
+class InsertCoalescer:
+    def __init__(self, name: str, window_ms: float, max_docs: int, enabled: bool = True):
+        self.name = name
+        self.window_ms = window_ms
+        self.max_docs = max_docs
+        self.enabled = enabled
+        self.batches = 0
+        self.documents = 0
+        self.counter_failures = 0
+        self._pending = {}
+        self._flushes = set()
+
+    async def insert(self, collection, document: dict):
+        if not self.enabled:
+            await collection.insert_one(document)
+            await self._count(collection, 1)
+            return
+
+        clock = None
+        if isinstance(collection, CausalCollection):
+            collection, clock = collection.collection, collection.clock
+
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(collection.full_name)
+        if batch is None:
+            batch = {"collection": collection, "entries": []}
+            batch["timer"] = loop.call_later(self.window_ms / 1000, self._start, batch, context=contextvars.Context())
+            self._pending[collection.full_name] = batch
+
+        future = loop.create_future()
+        batch["entries"].append((document, future, clock))
+        if len(batch["entries"]) >= self.max_docs:
+            self._start(batch)
+        await future
+
+    def _start(self, batch: dict):
+        full_name = batch["collection"].full_name
+        if self._pending.get(full_name) is not batch:
+            return
+        del self._pending[full_name]
+        batch["timer"].cancel()
+
+        # Started in an empty context, so that the batch does not inherit the deadline of a request
+        task = contextvars.Context().run(asyncio.ensure_future, self._flush(batch["collection"], batch["entries"]))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, collection, entries: list):
+        self.batches += 1
+        self.documents += len(entries)
+        documents = [document for document, _, _ in entries]
+        inserted, write_errors, failure = len(documents), {}, None
+        flush_clock = CausalClock(collection.database.client) if any(clock is not None for _, _, clock in entries) else None
+
+        try:
+            try:
+                if flush_clock is None:
+                    await collection.insert_many(documents, ordered=False)
+                else:
+                    # The callers sending causal tokens get the position of the batch
+                    async with flush_clock.session() as session:
+                        await collection.insert_many(documents, ordered=False, session=session)
+            except BulkWriteError as error:
+                inserted = error.details["nInserted"]
+                write_errors = {write_error["index"]: write_error for write_error in error.details["writeErrors"]}
+            await self._count(collection, inserted)
+        except asyncio.CancelledError:
+            for _, future, _ in entries:
+                future.cancel()
+            raise
+        except Exception as error:
+            failure = error
+
+        for index, (document, future, clock) in enumerate(entries):
+            if future.done():
+                continue
+            if failure is not None:
+                future.set_exception(failure)
+            elif index in write_errors:
+                write_error = write_errors[index]
+                error_class = DuplicateKeyError if write_error["code"] == 11000 else WriteError
+                future.set_exception(error_class(write_error["errmsg"], write_error["code"], write_error))
+            else:
+                if clock is not None:
+                    clock.observe(flush_clock)
+                future.set_result(None)
+
+    async def _count(self, collection, inserted: int):
+        try:
+            await increment_total(collection.database, collection.name, inserted)
+        except PyMongoError as error:
+            self.counter_failures += 1
+            print(f"Insert coalescing: failed to count {inserted} documents inserted into {collection.name} ({error})")
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "batches": self.batches,
+            "documents": self.documents,
+            "counter_failures": self.counter_failures,
+            "pending": sum(len(batch["entries"]) for batch in self._pending.values())
+        }
+
+"""
+Coalescer of the inserts of create_user
+"""
+user_inserts = InsertCoalescer("users", settings.insert_coalescing_window_ms, settings.insert_coalescing_max_docs, settings.insert_coalescing_enabled)
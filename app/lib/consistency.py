@@ -0,0 +1,192 @@
+import base64
+import binascii
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import bson
+from bson.errors import BSONError
+from fastapi import HTTPException, Response, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReadPreference
+
+"""
+Header carrying the causal-consistency token, returned by the writes and sent back by the client on its next reads
+"""
+CAUSAL_TOKEN_HEADER = "X-Causal-Token"
+
+"""
+Read preferences that can be configured for the list and lookup endpoints
+"""
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST
+}
+
+"""
+Collection methods that are run in a causally consistent session, the others are passed through
+"""
+SESSION_METHODS = {
+    "find_one", "count_documents", "distinct",
+    "insert_one", "insert_many", "replace_one", "update_one", "update_many", "delete_one", "delete_many",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete", "bulk_write"
+}
+
+"""
+Collection methods returning a cursor that is run in a causally consistent session once it is read
+"""
+CURSOR_METHODS = {"find", "aggregate"}
+
+"""
+    Causal position of a request: the highest cluster time and operation time it has seen.
+
+    Every operation runs in its own short causally consistent session, advanced to this position
+    beforehand and folded back into it afterwards. Reads therefore wait until the member they are
+    routed to has caught up with the writes of the token, and concurrent operations of a request
+    never share a session.
+"""
+class CausalClock:
+    def __init__(self, client, cluster_time: Optional[dict] = None, operation_time=None):
+        self.client = client
+        self.cluster_time = cluster_time
+        self.operation_time = operation_time
+
+    def observe(self, session):
+        if session.cluster_time is not None and (self.cluster_time is None or session.cluster_time["clusterTime"] > self.cluster_time["clusterTime"]):
+            self.cluster_time = session.cluster_time
+        if session.operation_time is not None and (self.operation_time is None or session.operation_time > self.operation_time):
+            self.operation_time = session.operation_time
+
+    @asynccontextmanager
+    async def session(self):
+        async with await self.client.start_session(causal_consistency=True) as session:
+            if self.cluster_time is not None:
+                session.advance_cluster_time(self.cluster_time)
+            if self.operation_time is not None:
+                session.advance_operation_time(self.operation_time)
+            try:
+                yield session
+            finally:
+                self.observe(session)
+
+    """
+    Opaque token of the position, None when the server reports no operation time (standalone server)
+    """
+    def token(self) -> Optional[str]:
+        if self.cluster_time is None or self.operation_time is None:
+            return None
+        raw = bson.encode({"clusterTime": self.cluster_time, "operationTime": self.operation_time})
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    """
+    Clock of a request, starting from the token sent by the client if any
+
+        Raises:
+            HTTPException: Invalid causal token error
+    """
+    @classmethod
+    def from_token(cls, client, token: Optional[str]) -> "CausalClock":
+        if not token:
+            return cls(client)
+
+        try:
+            position = bson.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            cluster_time, operation_time = position["clusterTime"], position["operationTime"]
+        except (binascii.Error, BSONError, ValueError, KeyError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid causal token")
+
+        if not isinstance(cluster_time, dict) or not isinstance(cluster_time.get("clusterTime"), bson.Timestamp) or not isinstance(operation_time, bson.Timestamp):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid causal token")
+        return cls(client, cluster_time, operation_time)
+
+"""
+Cursor built lazily, so that it is created and read within a single causally consistent session
+"""
+class CausalCursor:
+    def __init__(self, clock: CausalClock, collection, method: str, args, kwargs):
+        self.clock = clock
+        self.collection = collection
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self._calls = []
+
+    # sort, skip, limit, batch_size... are recorded and replayed on the real cursor
+    def __getattr__(self, name: str):
+        def chain(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+        return chain
+
+    def _cursor(self, session):
+        cursor = getattr(self.collection, self.method)(*self.args, session=session, **self.kwargs)
+        for name, args, kwargs in self._calls:
+            cursor = getattr(cursor, name)(*args, **kwargs)
+        return cursor
+
+    async def to_list(self, length: Optional[int]):
+        async with self.clock.session() as session:
+            return await self._cursor(session).to_list(length=length)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        async with self.clock.session() as session:
+            async for document in self._cursor(session):
+                yield document
+
+"""
+    Collection whose operations run in causally consistent sessions of a request.
+    Operations given an explicit session, e.g. within a transaction, run in that session instead.
+"""
+class CausalCollection:
+    def __init__(self, collection, clock: CausalClock):
+        self.collection = collection
+        self.clock = clock
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.collection, name)
+        if name in CURSOR_METHODS:
+            def cursor(*args, session=None, **kwargs):
+                if session is not None:
+                    return attribute(*args, session=session, **kwargs)
+                return CausalCursor(self.clock, self.collection, name, args, kwargs)
+            return cursor
+        if name not in SESSION_METHODS:
+            return attribute
+
+        async def run(*args, session=None, **kwargs):
+            if session is not None:
+                return await attribute(*args, session=session, **kwargs)
+            async with self.clock.session() as session:
+                return await attribute(*args, session=session, **kwargs)
+        return run
+
+"""
+    Database handed to the route handlers instead of the Motor database, with the same
+    db.collection / db["collection"] interface, running every operation at the causal position of the request.
+"""
+class CausalDatabase:
+    def __init__(self, database, clock: CausalClock):
+        self.database = database
+        self.clock = clock
+
+    def __getitem__(self, name: str) -> CausalCollection:
+        return CausalCollection(self.database[name], self.clock)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.database, name)
+        if isinstance(attribute, AsyncIOMotorCollection):
+            return CausalCollection(attribute, self.clock)
+        return attribute
+
+"""
+Return the causal position reached by the writes of a request to the client, in the X-Causal-Token header
+"""
+def set_causal_token(response: Response, db):
+    token = db.clock.token() if isinstance(db, CausalDatabase) else None
+    if token is not None:
+        response.headers[CAUSAL_TOKEN_HEADER] = token
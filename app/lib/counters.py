@@ -0,0 +1,113 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .. config import settings
+from .. models import TotalCount
+
+"""
+Collection holding one materialized counter document per counted collection,
+i.e. {"_id": "users", "count": 42}
+"""
+COUNTERS_COLLECTION = "counters"
+
+"""
+    Seed the materialized counters of collections from count_documents, leaving existing counters untouched.
+
+    Run by the migrations, before the API serves writes: an insert landing between the count and
+    the seed would otherwise be missed, as its increment_total finds no counter yet.
+"""
+async def seed_totals(db, *collection_names: str):
+    for collection_name in collection_names:
+        count = await db[collection_name].count_documents({})
+        await db[COUNTERS_COLLECTION].update_one(
+            {"_id": collection_name},
+            {"$setOnInsert": {"count": count}},
+            upsert=True
+        )
+
+"""
+    Get the exact number of documents in a collection from its materialized counter, kept up to date
+    by the write paths through increment_total. A collection without a counter is counted instead.
+
+    Returns:
+        _type_: int
+"""
+async def get_total(db, collection_name: str) -> int:
+    counter = await db[COUNTERS_COLLECTION].find_one({"_id": collection_name})
+    if counter is not None:
+        return counter["count"]
+    return await db[collection_name].count_documents({})
+
+"""
+Adjust the materialized counter of a collection after documents were inserted (positive amount) or deleted (negative amount).
+A counter that was never seeded is left alone, it is only seeded by the migrations.
+"""
+async def increment_total(db, collection_name: str, amount: int = 1):
+    if amount == 0:
+        return
+    await db[COUNTERS_COLLECTION].update_one({"_id": collection_name}, {"$inc": {"count": amount}})
+
+"""
+Bounded cache of filtered counts, keyed by collection and normalized query, each entry living for a short TTL
+"""
+class CountCache:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(collection_name: str, query: dict) -> str:
+        return collection_name + ":" + json.dumps(query, sort_keys=True, default=str)
+
+    def get(self, key: str) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, count = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return count
+
+    def set(self, key: str, count: int):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, count)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+count_cache = CountCache(settings.count_cache_max_size, settings.count_cache_ttl_seconds)
+
+"""
+    Get the total count for a list request.
+
+    Unfiltered lists are always answered from the materialized counter. Filtered lists are counted
+    according to the requested mode:
+        - exact: count_documents on every request
+        - cached: count_documents, cached for a short TTL per normalized query
+        - estimated: count_documents stopped at count_estimate_limit, so the result is a lower bound
+
+    Returns:
+        _type_: int
+"""
+async def get_total_count(db, collection_name: str, query: dict, mode: TotalCount = TotalCount.CACHED) -> int:
+    if not query:
+        return await get_total(db, collection_name)
+
+    if mode == TotalCount.ESTIMATED:
+        return await db[collection_name].count_documents(query, limit=settings.count_estimate_limit)
+
+    if mode == TotalCount.EXACT:
+        return await db[collection_name].count_documents(query)
+
+    key = CountCache.key(collection_name, query)
+    count = count_cache.get(key)
+    if count is None:
+        count = await db[collection_name].count_documents(query)
+        count_cache.set(key, count)
+    return count
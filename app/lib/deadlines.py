@@ -0,0 +1,165 @@
+import asyncio
+import contextlib
+import contextvars
+import time
+from typing import Optional
+
+import pymongo
+from fastapi import Request, status
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import JSONResponse
+from pymongo.errors import ExecutionTimeout, PyMongoError
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from .. config import settings
+from . admission import route_class
+from . metrics import registry, route_template
+
+"""
+Header lowering the deadline of a single request, in milliseconds
+"""
+DEADLINE_HEADER = b"x-request-timeout-ms"
+
+"""
+Deadlines of the routes that differ from request_timeout_ms, by "METHOD /route/template", 0 meaning no deadline.
+Exports stream for as long as the data takes, they are only bounded by the header.
+Settings.route_timeouts_ms takes precedence.
+"""
+ROUTE_TIMEOUTS_MS = {
+    "GET /users/export": 0,
+    "GET /organizations/export": 0
+}
+
+"""
+A timeout this close to the deadline is attributed to it
+"""
+DEADLINE_TOLERANCE_SECONDS = 0.05
+
+"""
+Monotonic deadline of the request being handled, None when it has none
+"""
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+"""
+    Deadline of a request in milliseconds, from the route setting or the default, lowered by the
+    X-Request-Timeout-Ms header and capped by max_request_timeout_ms.
+
+    Returns:
+        _type_: int or None when the request has no deadline
+"""
+def request_timeout_ms(method: str, route: str, headers) -> Optional[int]:
+    key = f"{method} {route}"
+    timeout = settings.route_timeouts_ms.get(key, ROUTE_TIMEOUTS_MS.get(key, settings.request_timeout_ms))
+
+    for name, value in headers:
+        if name == DEADLINE_HEADER:
+            try:
+                requested = int(value)
+            except ValueError:
+                break
+            if requested > 0:
+                timeout = min(requested, timeout) if timeout else requested
+            break
+
+    if not timeout:
+        return None
+    return min(timeout, settings.max_request_timeout_ms)
+
+"""
+Check if a Mongo error is the request running out of its deadline
+"""
+def deadline_exceeded(error: BaseException) -> bool:
+    deadline = request_deadline.get()
+    if deadline is None or not isinstance(error, PyMongoError) or not error.timeout:
+        return False
+    return isinstance(error, ExecutionTimeout) or time.monotonic() >= deadline - DEADLINE_TOLERANCE_SECONDS
+
+def deadline_response(request: Request) -> JSONResponse:
+    registry.inc("http_request_deadline_exceeded_total", (request.method, route_template(request.scope)))
+    return JSONResponse(status_code=status.HTTP_504_GATEWAY_TIMEOUT, content={"detail": "The request deadline was exceeded."})
+
+"""
+    Exception handlers answering 504 when a request runs out of its deadline.
+
+    Route handlers turn ConnectionFailure, which network timeouts derive from, into a 500, so the
+    HTTPException is checked for the Mongo error it was raised from. Other errors keep their usual
+    responses.
+"""
+async def http_exception_with_deadline_handler(request: Request, exc: StarletteHTTPException):
+    if exc.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR and deadline_exceeded(exc.__context__):
+        return deadline_response(request)
+    return await http_exception_handler(request, exc)
+
+async def mongo_error_handler(request: Request, exc: PyMongoError):
+    if deadline_exceeded(exc):
+        return deadline_response(request)
+    raise exc
+
+"""
+    ASGI middleware giving every read request a deadline and cancelling it when the client disconnects.
+
+    The deadline is applied with pymongo.timeout, so every Motor call of the request is sent with the
+    remaining time as maxTimeMS and fails once it is spent. The request runs in its own task while
+    the incoming messages are read ahead into a bounded queue, which lets a disconnect be seen while
+    the handler waits on Mongo. The handler is then cancelled and no further query is sent, the query
+    in flight is bounded by its maxTimeMS. Work left after a complete response, e.g. background tasks,
+    is not cancelled.
+
+    Only the requests that do not write, i.e. the list and read routes of admission control, are
+    interrupted. A write handler issues several dependent writes, e.g. a membership, the user and the
+    organization's member_count, which a cancellation or a timeout between two of them would leave
+    half applied, so writes always run to completion.
+"""
+class DeadlineMiddleware:
+    def __init__(self, app, queue_size: int = 16):
+        self.app = app
+        self.queue_size = queue_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, route = scope["method"], route_template(scope)
+        if route_class(method, route) == "write":
+            await self.app(scope, receive, send)
+            return
+
+        timeout_ms = request_timeout_ms(method, route, scope["headers"])
+        messages = asyncio.Queue(maxsize=self.queue_size)
+        disconnected, responded = False, False
+
+        async def send_tracking_completion(message):
+            nonlocal responded
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                responded = True
+            await send(message)
+
+        deadline_token = request_deadline.set(time.monotonic() + timeout_ms / 1000 if timeout_ms else None)
+        try:
+            # The task copies the context, along with the deadline
+            with pymongo.timeout(timeout_ms / 1000) if timeout_ms else contextlib.nullcontext():
+                handler = asyncio.ensure_future(self.app(scope, messages.get, send_tracking_completion))
+        finally:
+            request_deadline.reset(deadline_token)
+
+        async def read_ahead():
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not responded:
+                        disconnected = True
+                        handler.cancel()
+                    return
+
+        reader = asyncio.ensure_future(read_ahead())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+            registry.inc("http_requests_cancelled_total", (method, route))
+        finally:
+            reader.cancel()
@@ -0,0 +1,116 @@
+import asyncio
+import contextvars
+import datetime
+from bson import ObjectId
+
+from .. config import settings
+from . cache import user_cache
+from . counters import increment_total
+from . memberships import MEMBERSHIPS_COLLECTION, ORGANIZATION_DELETIONS_COLLECTION, remove_organization_from_members
+from . transactions import run_in_transaction
+from . versions import bump_version
+
+"""
+Background cleanups, referenced so that they are not garbage collected while running
+"""
+_cleanups = set()
+
+"""
+    Delete an organization along with all its memberships.
+
+    The organization is removed from the organizations list of every member with a single update_many
+    $pull on the users.organizations index. The writes run in a transaction when the server supports
+    them, so that readers never see a half deleted organization. The members are read first, so that
+    only their cached documents are invalidated.
+
+    Returns:
+        _type_: bool, False if the organization was already deleted, e.g. by a concurrent request
+"""
+async def delete_organization_with_members(db, organization_id: ObjectId) -> bool:
+    async def writes(session):
+        result = await db.organizations.delete_one({"_id": organization_id}, session=session)
+        if result.deleted_count == 0:
+            return None
+
+        users = await db.users.find({"organizations": organization_id}, {"_id": 1}, session=session).to_list(length=None)
+        await db.users.update_many({"organizations": organization_id}, bump_version({"$pull": {"organizations": organization_id}}), session=session)
+        await db[MEMBERSHIPS_COLLECTION].delete_many({"org_id": organization_id}, session=session)
+        return [user["_id"] for user in users]
+
+    user_ids = await run_in_transaction(db, writes)
+    if user_ids is None:
+        return False
+    user_cache.invalidate(*user_ids)
+    await increment_total(db, "organizations", -1)
+    return True
+
+"""
+    Delete an organization with too many members to be cleaned up within the request.
+
+    Only the organization document is deleted right away, along with a record of the pending cleanup,
+    in a transaction when the server supports them. The members are then cleaned up by
+    cleanup_organization_members.
+
+    Returns:
+        _type_: bool, False if the organization was already deleted, e.g. by a concurrent request
+"""
+async def start_organization_deletion(db, organization_id: ObjectId) -> bool:
+    async def writes(session):
+        await db[ORGANIZATION_DELETIONS_COLLECTION].update_one(
+            {"_id": organization_id},
+            {"$setOnInsert": {"started_at": datetime.datetime.utcnow()}},
+            upsert=True,
+            session=session
+        )
+        result = await db.organizations.delete_one({"_id": organization_id}, session=session)
+        return result.deleted_count == 1
+
+    # A concurrent deletion that lost the race leaves the record to the one that deleted the organization
+    deleted = await run_in_transaction(db, writes)
+    if deleted:
+        await increment_total(db, "organizations", -1)
+    return deleted
+
+"""
+    Remove the memberships of a deleted organization in chunks of batch_size, then drop the cleanup record.
+    Every step is idempotent, an interrupted cleanup is resumed at the next startup.
+"""
+async def cleanup_organization_members(db, organization_id: ObjectId, batch_size: int = None):
+    batch_size = batch_size or settings.delete_batch_size
+    while True:
+        memberships = await db[MEMBERSHIPS_COLLECTION]\
+                            .find({"org_id": organization_id}, {"_id": 0, "user_id": 1})\
+                            .limit(batch_size)\
+                            .to_list(length=batch_size)
+        if not memberships:
+            break
+
+        await remove_organization_from_members(db, organization_id, [membership["user_id"] for membership in memberships])
+
+    # Users added to the organization while it was being deleted
+    while True:
+        users = await db.users.find({"organizations": organization_id}, {"_id": 1}).limit(batch_size).to_list(length=batch_size)
+        if not users:
+            break
+
+        await remove_organization_from_members(db, organization_id, [user["_id"] for user in users])
+
+    await db[ORGANIZATION_DELETIONS_COLLECTION].delete_one({"_id": organization_id})
+
+"""
+    Run the member cleanup of a deleted organization in a background task.
+
+    The task starts from an empty context, so it outlives the request that scheduled it and is not
+    bound by its deadline.
+"""
+def schedule_organization_cleanup(db, organization_id: ObjectId):
+    task = contextvars.Context().run(asyncio.ensure_future, cleanup_organization_members(db, organization_id))
+    _cleanups.add(task)
+    task.add_done_callback(_cleanups.discard)
+
+"""
+Resume the member cleanups of deletions that were interrupted, e.g. by a restart, in the background
+"""
+async def resume_organization_deletions(db):
+    async for deletion in db[ORGANIZATION_DELETIONS_COLLECTION].find({}, {"_id": 1}):
+        schedule_organization_cleanup(db, deletion["_id"])
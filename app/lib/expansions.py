@@ -0,0 +1,110 @@
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from .. config import settings
+from . memberships import MEMBERSHIPS_COLLECTION
+
+"""
+Relations of an organization that can be expanded with expand=
+"""
+ORGANIZATION_EXPANSIONS = ("members",)
+
+"""
+Relations of a user that can be expanded with expand=
+"""
+USER_EXPANSIONS = ("organizations",)
+
+"""
+    Parse a comma separated expand= parameter into the relations to expand.
+
+    Raises:
+        HTTPException: Unknown relation error
+
+    Returns:
+        _type_: List[str], empty when nothing is expanded
+"""
+def parse_expand(expand: Optional[str], allowed: Tuple[str, ...]) -> List[str]:
+    if not expand:
+        return []
+
+    selected = {relation.strip() for relation in expand.split(",")} - {""}
+    unknown = selected - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown relations: {', '.join(sorted(unknown))}. Valid relations are: {', '.join(allowed)}"
+        )
+    return [relation for relation in allowed if relation in selected]
+
+"""
+    Expand the members of a page of organizations.
+
+    The first max_expand_size members of each organization are read with a single aggregate, whose
+    $lookup reads each organization's members from the (org_id, user_id) index and stops at the limit,
+    then the users of the whole page are read with a single de-duplicated $in query.
+    The documents are copied, as they can be shared with the read-through cache.
+
+    Returns:
+        _type_: List[dict], the organizations with a members list of {user_id, access_level, name, email}
+"""
+async def expand_members(db, organizations: List[dict]) -> List[dict]:
+    pages = db.organizations.aggregate([
+        {"$match": {"_id": {"$in": [organization["_id"] for organization in organizations]}}},
+        {"$project": {"_id": 1}},
+        {"$lookup": {
+            "from": MEMBERSHIPS_COLLECTION,
+            "let": {"org_id": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$org_id", "$$org_id"]}}},
+                {"$sort": {"user_id": 1}},
+                {"$limit": settings.max_expand_size},
+                {"$project": {"_id": 0, "user_id": 1, "access_level": 1}},
+            ],
+            "as": "members",
+        }},
+    ])
+    members_by_organization = {page["_id"]: page["members"] async for page in pages}
+    memberships = [members_by_organization.get(organization["_id"], []) for organization in organizations]
+
+    user_ids = list({membership["user_id"] for members in memberships for membership in members})
+    users = {}
+    if user_ids:
+        users = {user["_id"]: user async for user in db.users.find({"_id": {"$in": user_ids}}, {"name": 1, "email": 1})}
+
+    expanded = []
+    for organization, members in zip(organizations, memberships):
+        expanded.append(dict(organization, members=[
+            {
+                "user_id": membership["user_id"],
+                "access_level": membership["access_level"],
+                "name": users.get(membership["user_id"], {}).get("name"),
+                "email": users.get(membership["user_id"], {}).get("email")
+            }
+            for membership in members
+        ]))
+    return expanded
+
+"""
+    Expand the organizations of a page of users.
+
+    The first max_expand_size organization ids of each user are resolved with a single de-duplicated
+    $in query, organizations that no longer exist are left out. The documents are copied, as they can
+    be shared with the read-through cache.
+
+    Returns:
+        _type_: List[dict], the users with an organizations list of {_id, name, member_count}
+"""
+async def expand_organizations(db, users: List[dict]) -> List[dict]:
+    organization_ids = list({_id for user in users for _id in user.get("organizations", [])[:settings.max_expand_size]})
+    organizations = {}
+    if organization_ids:
+        organizations = {
+            organization["_id"]: {"_id": organization["_id"], "name": organization["name"], "member_count": organization.get("member_count", 0)}
+            async for organization in db.organizations.find({"_id": {"$in": organization_ids}}, {"name": 1, "member_count": 1})
+        }
+
+    return [
+        dict(user, organizations=[organizations[_id] for _id in user.get("organizations", [])[:settings.max_expand_size] if _id in organizations])
+        for user in users
+    ]
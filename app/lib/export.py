@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Callable, List
+
+from fastapi.responses import StreamingResponse
+
+from .. models import ExportFormat
+
+"""
+Size of the chunks written to the response, rows are grouped to avoid one write per document
+"""
+CHUNK_SIZE = 64 * 1024
+
+"""
+Columns of the exported users, in order
+"""
+USER_COLUMNS = ["_id", "name", "email", "organizations"]
+
+"""
+Columns of the exported organizations, in order
+"""
+ORGANIZATION_COLUMNS = ["_id", "name", "created_by", "member_count"]
+
+"""
+Exported record of a user document
+"""
+def user_record(document: dict) -> dict:
+    return {
+        "_id": str(document["_id"]),
+        "name": document["name"],
+        "email": document["email"],
+        "organizations": [str(organization_id) for organization_id in document.get("organizations", [])]
+    }
+
+"""
+Exported record of an organization document
+"""
+def organization_record(document: dict) -> dict:
+    return {
+        "_id": str(document["_id"]),
+        "name": document["name"],
+        "created_by": str(document["created_by"]),
+        "member_count": document.get("member_count", 0)
+    }
+
+"""
+Flatten a record into a CSV row, lists are joined with ";"
+"""
+def csv_row(record: dict, columns: List[str]) -> list:
+    return [";".join(record[column]) if isinstance(record[column], list) else record[column] for column in columns]
+
+"""
+    Encode the documents of a Motor cursor as NDJSON or CSV, in chunks of about CHUNK_SIZE.
+    The cursor is always closed, including when the client goes away mid-export.
+
+    Returns:
+        _type_: AsyncIterator[str]
+"""
+async def iter_export(cursor, to_record: Callable[[dict], dict], columns: List[str], export_format: ExportFormat) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == ExportFormat.CSV:
+        writer.writerow(columns)
+
+    try:
+        async for document in cursor:
+            record = to_record(document)
+            if export_format == ExportFormat.CSV:
+                writer.writerow(csv_row(record, columns))
+            else:
+                buffer.write(json.dumps(record, ensure_ascii=False))
+                buffer.write("\n")
+
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    finally:
+        await cursor.close()
+
+"""
+Streaming response of an export, downloaded as <name>.ndjson or <name>.csv
+"""
+def export_response(cursor, to_record: Callable[[dict], dict], columns: List[str], export_format: ExportFormat, name: str) -> StreamingResponse:
+    media_type = "text/csv" if export_format == ExportFormat.CSV else "application/x-ndjson"
+    return StreamingResponse(
+        iter_export(cursor, to_record, columns, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format.value}"'}
+    )
@@ -0,0 +1,141 @@
+import asyncio
+import contextvars
+from typing import Dict
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from .. config import settings
+from . cache import ReadThroughCache, user_cache, organization_cache
+
+"""
+Server errors after which the stream cannot be resumed from its token, and is restarted from now
+"""
+NON_RESUMABLE_ERRORS = {
+    260,    # InvalidResumeToken
+    280,    # ChangeStreamFatalError
+    286     # ChangeStreamHistoryLost
+}
+
+"""
+Changes after which the whole caches are emptied, rather than single documents
+"""
+CLEARING_OPERATIONS = {"drop", "rename", "dropDatabase", "invalidate"}
+
+"""
+Server error of a change stream opened on a standalone server, which has no oplog to watch
+"""
+CHANGE_STREAMS_NOT_SUPPORTED = 40573
+
+"""
+    Background consumer of a change stream on the cached collections, invalidating the documents
+    written by any worker in the caches of this one.
+
+    The resume token is kept in memory, so that a stream that drops picks up where it stopped. It is
+    not persisted, since a worker that boots has empty caches and nothing to catch up on. While the
+    stream is down, and before it first opens, the caches are emptied and their TTL is lowered to fallback_ttl_seconds, which bounds the staleness of what
+    they serve. On a standalone server, which has no change streams, the caches stay in that mode.
+"""
+class CacheInvalidator:
+    def __init__(self, name: str, caches: Dict[str, ReadThroughCache], fallback_ttl_seconds: float, retry_seconds: float, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.caches = caches
+        self.fallback_ttl_seconds = fallback_ttl_seconds
+        self.retry_seconds = retry_seconds
+        self.connected = False
+        self.events = 0
+        self.restarts = 0
+        self._ttl_seconds = {collection: cache.ttl_seconds for collection, cache in caches.items()}
+        self._task = None
+
+    def _fall_back(self):
+        self.connected = False
+        for cache in self.caches.values():
+            cache.clear()
+            cache.ttl_seconds = min(cache.ttl_seconds, self.fallback_ttl_seconds)
+
+    def _recover(self):
+        self.connected = True
+        for collection, cache in self.caches.items():
+            cache.ttl_seconds = self._ttl_seconds[collection]
+
+    """
+    Invalidate the document of a change, or everything when a whole collection is dropped or renamed
+    """
+    def apply(self, change: dict):
+        self.events += 1
+        if change["operationType"] in CLEARING_OPERATIONS:
+            for cache in self.caches.values():
+                cache.clear()
+            return
+
+        cache = self.caches.get(change.get("ns", {}).get("coll"))
+        if cache is not None and "documentKey" in change:
+            cache.invalidate(change["documentKey"]["_id"])
+
+    async def _run(self, db):
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self.caches)}}}]
+        token = None
+        while True:
+            try:
+                async with db.watch(pipeline, resume_after=token) as stream:
+                    self._recover()
+                    print(f"Cache invalidation: watching {', '.join(self.caches)}")
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None:
+                            self.apply(change)
+                        token = stream.resume_token
+                # An invalidated stream cannot be resumed after its last event
+                token = None
+            except OperationFailure as error:
+                if error.code == CHANGE_STREAMS_NOT_SUPPORTED:
+                    print(f"Cache invalidation: change streams are not supported, caches are kept for {self.fallback_ttl_seconds}s")
+                    return
+                if error.code in NON_RESUMABLE_ERRORS:
+                    token = None
+                print(f"Cache invalidation: change stream failed ({error})")
+            except PyMongoError as error:
+                print(f"Cache invalidation: change stream failed ({error})")
+
+            self._fall_back()
+            self.restarts += 1
+            await asyncio.sleep(self.retry_seconds)
+
+    """
+    Start the consumer, in an empty context so that it does not inherit the deadline of anything
+    """
+    def start(self, db):
+        if not self.enabled:
+            return
+        self._fall_back()
+        if self._task is None:
+            self._task = contextvars.Context().run(asyncio.ensure_future, self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "connected": self.connected,
+            "events": self.events,
+            "restarts": self.restarts
+        }
+
+"""
+Invalidator of the user and organization caches
+"""
+cache_invalidator = CacheInvalidator(
+    "caches",
+    {"users": user_cache, "organizations": organization_cache},
+    settings.cache_fallback_ttl_seconds,
+    settings.cache_invalidation_retry_seconds,
+    enabled=settings.cache_enabled and settings.cache_invalidation_enabled
+)
@@ -0,0 +1,47 @@
+import asyncio
+from typing import List
+
+from bson import ObjectId
+
+from . cache import ReadThroughCache
+from . consistency import CausalCollection
+
+"""
+    Resolve a mixed list of ids and unique keys (emails or names) with at most two $in queries.
+
+    Keys are de-duplicated and split on ObjectId.is_valid like the single lookups, each group is
+    read through the cache, and only the keys the cache misses are sent to Mongo. Every input key
+    ends up either in the results or in the misses.
+
+    Reads routed to secondaries or following a causal token, i.e. through a CausalCollection, bypass
+    the cache: their documents can be older than the cached ones, and must not replace them for the
+    reads from the primary.
+
+    Returns:
+        _type_: dict with results (input key -> document) and missing (input keys not found)
+"""
+async def bulk_lookup(collection, cache: ReadThroughCache, alias_field: str, keys: List[str]) -> dict:
+    keys = list(dict.fromkeys(keys))
+    ids = [ObjectId(key) for key in keys if ObjectId.is_valid(key)]
+    aliases = [key for key in keys if not ObjectId.is_valid(key)]
+
+    def loader(field: str):
+        return lambda values: collection.find({field: {"$in": values}}).to_list(length=None)
+
+    async def load(field: str, values: list) -> dict:
+        if not values:
+            return {}
+        if isinstance(collection, CausalCollection):
+            return {document[field]: document for document in await loader(field)(values)}
+        return await cache.get_many_or_load(field, values, loader(field))
+
+    by_id, by_alias = await asyncio.gather(load("_id", ids), load(alias_field, aliases))
+
+    results, missing = {}, []
+    for key in keys:
+        document = by_id.get(ObjectId(key)) if ObjectId.is_valid(key) else by_alias.get(key)
+        if document is None:
+            missing.append(key)
+        else:
+            results[key] = document
+    return {"results": results, "missing": missing}
@@ -0,0 +1,193 @@
+from typing import List
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument, UpdateOne
+
+from . cache import user_cache
+from . helper_functions import get_access_level_enum
+from . versions import VERSION_FIELD, bump_version
+
+"""
+Collection holding one document per member of an organization, i.e. {"org_id", "user_id", "access_level"}
+"""
+MEMBERSHIPS_COLLECTION = "memberships"
+
+"""
+Collection recording the organizations whose members are still being cleaned up in the background,
+i.e. {"_id": organization_id, "started_at": datetime}
+"""
+ORGANIZATION_DELETIONS_COLLECTION = "organization_deletions"
+
+"""
+Unique indexes of the memberships collection, by organization (members of an org) and by user (orgs of a user)
+"""
+async def create_membership_indexes(db):
+    await db[MEMBERSHIPS_COLLECTION].create_index([("org_id", 1), ("user_id", 1)], unique=True, background=True)
+    await db[MEMBERSHIPS_COLLECTION].create_index([("user_id", 1), ("org_id", 1)], unique=True, background=True)
+
+"""
+    Read an organization along with the check that the author is one of its ADMINs, in a single aggregate.
+
+    The membership of the author is looked up from the organization document, with a point lookup on
+    the (org_id, user_id) index, so the check and the organization fields come from the same read.
+    An organization that is being deleted is not found, even while its memberships are cleaned up.
+    Within a transaction, pass its session so that the writes based on this read conflict with concurrent
+    changes of the organization, e.g. the author losing the ADMIN access level.
+
+    Raises:
+        HTTPException: Organization not found error
+        HTTPException: Author is not an ADMIN error
+
+    Returns:
+        _type_: Organization, with _id, created_by, member_count and version
+"""
+async def get_organization_as_admin(db, organization_id: ObjectId, author_id: ObjectId, session=None) -> dict:
+    organizations = await db.organizations.aggregate([
+        {"$match": {"_id": organization_id}},
+        {"$project": {"created_by": 1, "member_count": 1, VERSION_FIELD: 1}},
+        {"$lookup": {
+            "from": MEMBERSHIPS_COLLECTION,
+            "pipeline": [
+                {"$match": {"org_id": organization_id, "user_id": author_id, "access_level": "ADMIN"}},
+                {"$limit": 1},
+                {"$project": {"_id": 1}},
+            ],
+            "as": "author",
+        }},
+        {"$lookup": {
+            "from": ORGANIZATION_DELETIONS_COLLECTION,
+            "pipeline": [{"$match": {"_id": organization_id}}, {"$project": {"_id": 1}}],
+            "as": "deletion",
+        }},
+    ], session=session).to_list(length=1)
+
+    if not organizations or organizations[0].pop("deletion"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
+
+    organization = organizations[0]
+    if not organization.pop("author"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Author is not an ADMIN of the organization")
+    return organization
+
+"""
+    Remove some members of an organization, i.e. the organization from their organizations list with one
+    update_many $pull and their memberships with one delete_many, and invalidate their cached documents.
+"""
+async def remove_organization_from_members(db, organization_id: ObjectId, user_ids: List[ObjectId]):
+    await db.users.update_many({"_id": {"$in": user_ids}, "organizations": organization_id}, bump_version({"$pull": {"organizations": organization_id}}))
+    await db[MEMBERSHIPS_COLLECTION].delete_many({"org_id": organization_id, "user_id": {"$in": user_ids}})
+    user_cache.invalidate(*user_ids)
+
+"""
+    Apply a change of the members to an organization read by get_organization_as_admin.
+
+    The version is bumped along, unless claim_version already claimed it for If-Match before the member
+    writes. Within a transaction, a write that matches nothing aborts the member writes that preceded it.
+    Without one, they cannot be rolled back, and the members of an organization deleted meanwhile are
+    removed again.
+
+    Raises:
+        HTTPException: Organization not found error
+
+    Returns:
+        _type_: Organization
+"""
+async def update_organization_members(db, organization: dict, update: dict, claimed: bool, user_ids: List[ObjectId], session=None, projection=None) -> dict:
+    _id = organization["_id"]
+    if not claimed:
+        updated = await db.organizations.find_one_and_update({"_id": _id}, bump_version(update), projection=projection, return_document=ReturnDocument.AFTER, session=session)
+    elif update:
+        updated = await db.organizations.find_one_and_update({"_id": _id}, update, projection=projection, return_document=ReturnDocument.AFTER, session=session)
+    else:
+        updated = await db.organizations.find_one({"_id": _id}, projection, session=session)
+
+    if updated is not None:
+        return updated
+    if session is None:
+        await remove_organization_from_members(db, _id, user_ids)
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
+
+"""
+    Validate every operation of a member batch against the current members of the organization.
+
+    members maps the users of the batch that are members to their access level, and
+    existing_user_ids holds the ids of the users that are to be added and exist.
+
+    Returns:
+        _type_: (results, members_to_add, updates_by_access_level, user_ids_to_remove)
+"""
+def plan_member_batch(batch, created_by: ObjectId, members: dict, existing_user_ids: set):
+    results, seen = [], set()
+    members_to_add, updates_by_access_level, user_ids_to_remove = [], {}, []
+
+    operations = [("add", item) for item in batch.add] + [("update", item) for item in batch.update] + [("remove", item) for item in batch.remove]
+    for operation, item in operations:
+        user_id = ObjectId(item.user_id)
+        access_level = get_access_level_enum(item.access_level) if operation != "remove" else None
+
+        detail = None
+        if user_id in seen:
+            detail = "User appears more than once in the batch"
+        elif operation != "remove" and access_level is None:
+            detail = "Invalid access level. Valid access levels are: ADMIN, WRITE, READ"
+        elif operation == "add" and user_id not in existing_user_ids:
+            detail = "User not found"
+        elif operation == "add" and user_id in members:
+            detail = "User already exists in the organization"
+        elif operation == "remove" and created_by == user_id:
+            detail = "Cannot remove the creator of the organization"
+        elif operation != "add" and user_id not in members:
+            detail = "User does not exist in the organization"
+        seen.add(user_id)
+
+        results.append({"operation": operation, "user_id": user_id, "success": detail is None, "detail": detail})
+        if detail is not None:
+            continue
+
+        if operation == "add":
+            members_to_add.append({"user_id": user_id, "access_level": access_level})
+        elif operation == "update":
+            updates_by_access_level.setdefault(access_level, []).append(user_id)
+        else:
+            user_ids_to_remove.append(user_id)
+
+    return results, members_to_add, updates_by_access_level, user_ids_to_remove
+
+"""
+    Move the embedded members arrays of the organizations into the memberships collection.
+
+    Organizations are converted one at a time, their members written in chunks of batch_size with
+    idempotent upserts, then the array is replaced by member_count. An interrupted run can simply be
+    started again.
+
+    Returns:
+        _type_: (organizations, memberships) converted
+"""
+async def migrate_embedded_members(db, batch_size: int = 1000, log=print):
+    converted_organizations, converted_memberships = 0, 0
+    while True:
+        organization = await db.organizations.find_one({"members": {"$exists": True}}, {"members": 1})
+        if organization is None:
+            return converted_organizations, converted_memberships
+
+        members = organization["members"]
+        for start in range(0, len(members), batch_size):
+            await db[MEMBERSHIPS_COLLECTION].bulk_write([
+                UpdateOne(
+                    {"org_id": organization["_id"], "user_id": member["user_id"]},
+                    {"$setOnInsert": {"access_level": member["access_level"]}},
+                    upsert=True
+                )
+                for member in members[start:start + batch_size]
+            ], ordered=False)
+
+        member_count = await db[MEMBERSHIPS_COLLECTION].count_documents({"org_id": organization["_id"]})
+        await db.organizations.update_one(
+            {"_id": organization["_id"]},
+            bump_version({"$unset": {"members": ""}, "$set": {"member_count": member_count}})
+        )
+
+        converted_organizations += 1
+        converted_memberships += len(members)
+        log(f"Migrated organization {organization['_id']}: {len(members)} members")
@@ -0,0 +1,215 @@
+import contextvars
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+"""
+Upper bounds, in seconds, of the buckets of the latency histograms
+"""
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+"""
+Upper bounds of the buckets of the Mongo round trips per request histogram
+"""
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50, 100)
+
+"""
+Label of the Mongo commands that were not issued by a request, e.g. at startup or by background tasks
+"""
+NO_ROUTE = "none"
+
+"""
+Cumulative histogram of observations, in the Prometheus layout
+"""
+class Histogram:
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+"""
+Route and Mongo round trips of the request being handled, shared with the command listener through a ContextVar.
+Motor runs pymongo in a thread pool with a copy of the context, so the listener sees the request that issued each command.
+"""
+class RequestStats:
+    def __init__(self, method: str, route: str):
+        self.method = method
+        self.route = route
+        self.round_trips = 0
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request", default=None)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+"""
+    Registry of the request and Mongo command metrics, rendered in the Prometheus text format.
+
+    Requests are updated from the event loop and commands from the driver threads, every update
+    holds the lock.
+"""
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._gauges: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._metadata: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {}
+
+    def _register(self, kind: str, name: str, description: str, labels: Tuple[str, ...]):
+        self._metadata[name] = (kind, description, labels)
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...]):
+        self._register("counter", name, description, labels)
+        self._counters[name] = {}
+
+    def gauge(self, name: str, description: str, labels: Tuple[str, ...]):
+        self._register("gauge", name, description, labels)
+        self._gauges[name] = {}
+
+    def histogram(self, name: str, description: str, labels: Tuple[str, ...], buckets: Iterable[float] = LATENCY_BUCKETS):
+        self._register("histogram", name, description, labels)
+        self._histograms[name] = {}
+        self._buckets[name] = tuple(buckets)
+
+    def inc(self, name: str, labels: Tuple, amount: float = 1):
+        with self._lock:
+            self._counters[name][labels] = self._counters[name].get(labels, 0) + amount
+
+    def add(self, name: str, labels: Tuple, amount: float):
+        with self._lock:
+            self._gauges[name][labels] = self._gauges[name].get(labels, 0) + amount
+
+    def observe(self, name: str, labels: Tuple, value: float):
+        with self._lock:
+            histogram = self._histograms[name].get(labels)
+            if histogram is None:
+                histogram = self._histograms[name][labels] = Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    """
+    Prometheus text exposition of every metric, followed by the given samples of other components,
+    each as (name, type, description, label names, {label values: value}).
+    """
+    def render(self, extra: Iterable[Tuple[str, str, str, Tuple[str, ...], Dict[Tuple, float]]] = ()) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, description, label_names) in self._metadata.items():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "histogram":
+                    for labels, histogram in self._histograms[name].items():
+                        for bound, count in [*zip(histogram.buckets, histogram.counts), ("+Inf", histogram.count)]:
+                            le = 'le="' + str(bound) + '"'
+                            lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {count}")
+                        lines.append(f"{name}_sum{_labels(label_names, labels)} {histogram.sum}")
+                        lines.append(f"{name}_count{_labels(label_names, labels)} {histogram.count}")
+                else:
+                    samples = self._counters[name] if kind == "counter" else self._gauges[name]
+                    for labels, value in samples.items():
+                        lines.append(f"{name}{_labels(label_names, labels)} {value}")
+
+        for name, kind, description, label_names, samples in extra:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples.items():
+                lines.append(f"{name}{_labels(label_names, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+registry.counter("http_requests_total", "Requests handled, by route and status code", ("method", "route", "status"))
+registry.gauge("http_requests_in_flight", "Requests being handled, by route", ("method", "route"))
+registry.histogram("http_request_duration_seconds", "Latency of the requests, by route", ("method", "route"))
+registry.histogram("http_request_mongo_round_trips", "Mongo commands sent per request, by route", ("method", "route"), ROUND_TRIP_BUCKETS)
+registry.counter("http_request_deadline_exceeded_total", "Requests answered with 504 after running out of their deadline, by route", ("method", "route"))
+registry.counter("http_requests_cancelled_total", "Requests cancelled because the client disconnected, by route", ("method", "route"))
+registry.counter("admission_rejected_total", "Requests shed by admission control, by route class and reason", ("route_class", "reason"))
+registry.counter("mongo_commands_total", "Mongo commands, by issuing route, command and outcome", ("route", "command", "outcome"))
+registry.histogram("mongo_command_duration_seconds", "Latency of the Mongo commands, by issuing route and command", ("route", "command"))
+
+"""
+Path template of the route matching a request, e.g. /organizations/{organization_id}/members, so that labels stay bounded
+"""
+def route_template(scope) -> str:
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+"""
+    ASGI middleware recording the count, in-flight gauge, latency and Mongo round trips of every
+    request, labelled by method and route template.
+"""
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope["method"], route_template(scope))
+        labels = (stats.method, stats.route)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = current_request.set(stats)
+        registry.add("http_requests_in_flight", labels, 1)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            registry.observe("http_request_duration_seconds", labels, time.perf_counter() - started)
+            registry.observe("http_request_mongo_round_trips", labels, stats.round_trips)
+            registry.inc("http_requests_total", (*labels, status_code))
+            registry.add("http_requests_in_flight", labels, -1)
+            current_request.reset(token)
+
+"""
+pymongo command listener attributing every command, its duration and outcome to the route that issued it
+"""
+class CommandMetrics(monitoring.CommandListener):
+    def _record(self, event, outcome: str):
+        stats = current_request.get()
+        route = NO_ROUTE
+        if stats is not None:
+            stats.round_trips += 1
+            route = stats.route
+        registry.inc("mongo_commands_total", (route, event.command_name, outcome))
+        registry.observe("mongo_command_duration_seconds", (route, event.command_name), event.duration_micros / 1e6)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event, "succeeded")
+
+    def failed(self, event):
+        self._record(event, "failed")
+
+command_metrics = CommandMetrics()
@@ -0,0 +1,125 @@
+import time
+from typing import Awaitable, Callable, List, NamedTuple
+
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from . search import NORMALIZED_NAME_FIELD, backfill_normalized_names
+from . memberships import create_membership_indexes, migrate_embedded_members
+from . counters import seed_totals
+
+"""
+Collection recording the applied migrations, i.e. {"_id": version, "description", "applied_at", "duration_seconds"}
+"""
+MIGRATIONS_COLLECTION = "_migrations"
+
+"""
+Raised at startup when the database is behind the migrations of the code
+"""
+class MigrationsPending(Exception):
+    pass
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[..., Awaitable[None]]
+
+"""
+    Unique indexes of users and organizations, and the (name, _id) indexes of the keyset pagination.
+
+    All the indexes are built with background=True, which keeps servers older than 4.2 from locking
+    the collection during the build. Newer servers ignore it, their builds never block.
+"""
+async def create_base_indexes(db, batch_size: int):
+    await db.users.create_index("email", unique=True, background=True)
+    await db.organizations.create_index("name", unique=True, background=True)
+    await db.organizations.create_index("created_by", unique=True, background=True)
+    await db.users.create_index([("name", 1), ("_id", 1)], background=True)
+    await db.organizations.create_index([("name", 1), ("_id", 1)], background=True)
+
+"""
+Name search indexes, and the normalized names of the documents written before them
+"""
+async def create_name_search_indexes(db, batch_size: int):
+    await db.users.create_index(NORMALIZED_NAME_FIELD, background=True)
+    await db.organizations.create_index(NORMALIZED_NAME_FIELD, background=True)
+    await db.users.create_index([("name", "text")], background=True)
+    await db.organizations.create_index([("name", "text")], background=True)
+    await backfill_normalized_names(db.users, batch_size)
+    await backfill_normalized_names(db.organizations, batch_size)
+
+"""
+Memberships collection: members of an organization and organizations of a user, and the embedded members arrays moved into it
+"""
+async def create_memberships(db, batch_size: int):
+    await create_membership_indexes(db)
+    await db.users.create_index("organizations", background=True)
+    await migrate_embedded_members(db, batch_size)
+
+"""
+Materialized counters of the unfiltered list totals, seeded before the API that maintains them serves writes
+"""
+async def seed_counters(db, batch_size: int):
+    await seed_totals(db, "users", "organizations")
+
+"""
+Migrations of the database, in order. A migration is only ever appended, never edited once released.
+"""
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Unique and keyset pagination indexes", create_base_indexes),
+    Migration(2, "Name search indexes and normalized names", create_name_search_indexes),
+    Migration(3, "Memberships collection", create_memberships),
+    Migration(4, "Materialized counters", seed_counters)
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+"""
+Version of the last migration applied to the database, 0 when none was
+"""
+async def current_version(db) -> int:
+    migration = await db[MIGRATIONS_COLLECTION].find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    return migration["_id"] if migration is not None else 0
+
+"""
+    Apply the migrations the database is missing, up to target, recording each one once it is done.
+    Migrations are idempotent, a run that is interrupted or races with another one can simply be started again.
+
+    Returns:
+        _type_: List[Migration] applied
+"""
+async def apply_migrations(db, target: int = LATEST_VERSION, batch_size: int = 1000, log=print) -> List[Migration]:
+    version = await current_version(db)
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= version or migration.version > target:
+            continue
+
+        log(f"Applying migration {migration.version}: {migration.description}")
+        started = time.monotonic()
+        await migration.apply(db, batch_size)
+        duration = time.monotonic() - started
+        try:
+            await db[MIGRATIONS_COLLECTION].insert_one({
+                "_id": migration.version,
+                "description": migration.description,
+                "applied_at": time.time(),
+                "duration_seconds": round(duration, 3)
+            })
+        except DuplicateKeyError:
+            log(f"Migration {migration.version} was recorded by another run")
+        log(f"Applied migration {migration.version} in {duration:.2f}s")
+        applied.append(migration)
+    return applied
+
+"""
+    Readiness check of the startup, a single indexed read of the migration version.
+
+    Raises:
+        MigrationsPending: The database is behind the migrations of the code
+"""
+async def check_migrations(db) -> int:
+    version = await current_version(db)
+    if version < LATEST_VERSION:
+        raise MigrationsPending(f"Database is at migration {version} of {LATEST_VERSION}, run python -m app.migrate")
+    return version
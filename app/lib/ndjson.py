@@ -0,0 +1,45 @@
+from typing import AsyncIterator, Optional, Tuple
+
+"""
+    Split a stream of bytes chunks into NDJSON lines, without holding more than one line in memory.
+
+    Blank lines are skipped. A line longer than max_line_bytes is dropped and yielded as None so
+    that the caller can report it, whatever its size.
+
+    Returns:
+        _type_: AsyncIterator[(line_number, line)]
+"""
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    buffer = bytearray()
+    line_number = 0
+    overflow = False
+
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end == -1:
+                if not overflow:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        overflow = True
+                        buffer.clear()
+                break
+
+            line_number += 1
+            if overflow:
+                yield line_number, None
+            else:
+                buffer += chunk[start:end]
+                line = bytes(buffer).strip()
+                if len(buffer) > max_line_bytes:
+                    yield line_number, None
+                elif line:
+                    yield line_number, line
+            buffer.clear()
+            overflow = False
+            start = end + 1
+
+    line = bytes(buffer).strip()
+    if overflow or line:
+        yield line_number + 1, None if overflow else line
@@ -0,0 +1,120 @@
+import base64
+import binascii
+import json
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import ASCENDING, DESCENDING
+
+from .. models import SortField
+
+"""
+Encode the sort key of a document into an opaque cursor.
+The cursor holds [_id] when sorting by id and [name, _id] when sorting by name.
+"""
+def encode_cursor(document: dict, sort_by: SortField) -> str:
+    keyset = [str(document["_id"])]
+    if sort_by == SortField.NAME:
+        keyset.insert(0, document["name"])
+
+    raw = json.dumps(keyset, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+"""
+Decode an opaque cursor back into its sort key.
+
+    Raises:
+        HTTPException: Invalid cursor error
+"""
+def decode_cursor(cursor: str, sort_by: SortField) -> list:
+    invalid_cursor = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        keyset = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise invalid_cursor
+
+    expected_length = 2 if sort_by == SortField.NAME else 1
+    if not isinstance(keyset, list) or len(keyset) != expected_length or not ObjectId.is_valid(keyset[-1]):
+        raise invalid_cursor
+
+    if sort_by == SortField.NAME and not isinstance(keyset[0], str):
+        raise invalid_cursor
+
+    keyset[-1] = ObjectId(keyset[-1])
+    return keyset
+
+"""
+Mongo sort specification for a sort field, in either direction.
+The _id tie-breaker keeps the order total so that cursors never skip or repeat documents.
+"""
+def sort_spec(sort_by: SortField, forward: bool = True) -> List[Tuple[str, int]]:
+    direction = ASCENDING if forward else DESCENDING
+    if sort_by == SortField.NAME:
+        return [("name", direction), ("_id", direction)]
+    return [("_id", direction)]
+
+"""
+Combine a filter query with the keyset condition of a cursor
+"""
+def keyset_query(query: dict, sort_by: SortField, keyset: list, forward: bool = True) -> dict:
+    operator = "$gt" if forward else "$lt"
+
+    if sort_by == SortField.NAME:
+        name, _id = keyset
+        condition = {"$or": [{"name": {operator: name}}, {"name": name, "_id": {operator: _id}}]}
+    else:
+        condition = {"_id": {operator: keyset[0]}}
+
+    if not query:
+        return condition
+    return {"$and": [query, condition]}
+
+"""
+    Fetch a single page of documents from a collection.
+
+    Pages are addressed either by an opaque `after`/`before` cursor (keyset pagination, constant
+    cost at any depth) or by a capped offset. One extra document is read to know whether a further
+    page exists, so no count is needed to build the cursors. A projection must keep the sort key.
+
+    Raises:
+        HTTPException: Invalid pagination parameters error
+        HTTPException: Invalid cursor error
+
+    Returns:
+        _type_: dict with documents, next_cursor and prev_cursor
+"""
+async def paginate(collection, query: dict, sort_by: SortField, limit: int, offset: int = 0, after: Optional[str] = None, before: Optional[str] = None, projection: Optional[dict] = None) -> dict:
+    if after and before:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only one of after and before can be used")
+
+    if (after or before) and offset:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Offset cannot be combined with a cursor")
+
+    forward = before is None
+    cursor = after or before
+    if cursor:
+        query = keyset_query(query, sort_by, decode_cursor(cursor, sort_by), forward)
+
+    documents = await collection\
+                    .find(query, projection)\
+                    .sort(sort_spec(sort_by, forward))\
+                    .skip(offset)\
+                    .limit(limit + 1)\
+                    .to_list(length=limit + 1)
+
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    if not forward:
+        documents.reverse()
+
+    next_cursor, prev_cursor = None, None
+    if documents:
+        if has_more or not forward:
+            next_cursor = encode_cursor(documents[-1], sort_by)
+        if (has_more and not forward) or (forward and (after or offset)):
+            prev_cursor = encode_cursor(documents[0], sort_by)
+
+    return {"documents": documents, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
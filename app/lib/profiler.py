@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import threading
+import time
+from typing import Optional
+
+from pymongo import monitoring
+
+from .. config import settings
+from . metrics import current_request, NO_ROUTE
+
+"""
+Commands whose plan can be explained, and where their filter is found
+"""
+EXPLAINABLE_COMMANDS = {
+    "find": lambda command: command.get("filter", {}),
+    "aggregate": lambda command: command.get("pipeline", []),
+    "count": lambda command: command.get("query", {}),
+    "distinct": lambda command: command.get("query", {}),
+    "findAndModify": lambda command: command.get("query", {}),
+    "update": lambda command: [update.get("q", {}) for update in command.get("updates", [])],
+    "delete": lambda command: [delete.get("q", {}) for delete in command.get("deletes", [])]
+}
+
+"""
+Fields added to the commands by the driver, which explain does not accept
+"""
+DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern", "$db", "$clusterTime", "$readPreference"}
+
+"""
+Filter shape with the literal values replaced by "?", e.g. {"name_lower": {"$regex": "?"}}, so that the
+same query with different values is recorded once. Operators and field names are kept.
+"""
+def query_shape(value):
+    if isinstance(value, dict):
+        return {key: query_shape(item) if key.startswith("$") or isinstance(item, (dict, list)) else "?" for key, item in value.items()}
+    if isinstance(value, list):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+"""
+Execution statistics of an explain output, found at the top for find and inside the $cursor stage for aggregate
+"""
+def find_execution_stats(explain: dict) -> Optional[dict]:
+    if "executionStats" in explain:
+        return explain["executionStats"]
+    for stage in explain.get("stages", []):
+        if "$cursor" in stage:
+            return find_execution_stats(stage["$cursor"])
+    return None
+
+"""
+Stages of the winning plan from the root, e.g. "LIMIT > FETCH > IXSCAN", where a COLLSCAN shows a collection scan
+"""
+def plan_summary(explain: dict) -> Optional[str]:
+    planner = explain.get("queryPlanner") or next((stage["$cursor"].get("queryPlanner") for stage in explain.get("stages", []) if "$cursor" in stage), None)
+    if planner is None:
+        return None
+
+    stages, plan = [], planner.get("winningPlan", {})
+    while plan:
+        stages.append(plan.get("stage", "?"))
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " > ".join(stages)
+
+"""
+    pymongo command listener flagging the commands slower than profiler_threshold_ms.
+
+    Each slow command is recorded by the shape of its filter, and its plan is explained with
+    executionStats from a task on the event loop, off the request path, the first time the shape is
+    seen and whenever it gets slower. Only the profiler_max_entries slowest shapes are kept.
+"""
+class SlowQueryProfiler(monitoring.CommandListener):
+    def __init__(self, enabled: bool, threshold_ms: float, max_entries: int):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._started = {}
+        self._entries = {}
+        self._explains = set()
+        self._loop = None
+        self._client = None
+
+    """
+    Bind the profiler to the event loop and client that run the explains, called once the client is created
+    """
+    def attach(self, loop: asyncio.AbstractEventLoop, client):
+        self._loop = loop
+        self._client = client
+
+    def started(self, event):
+        if not self.enabled or event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        with self._lock:
+            # Commands whose outcome is never reported must not pile up
+            if len(self._started) >= 10000:
+                self._started.clear()
+            self._started[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if started is None or duration_ms < self.threshold_ms:
+            return
+
+        database_name, command = started
+        stats = current_request.get()
+        key = (database_name, command[event.command_name], event.command_name, repr(query_shape(EXPLAINABLE_COMMANDS[event.command_name](command))))
+        explain = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    "namespace": f"{database_name}.{command[event.command_name]}",
+                    "command": event.command_name,
+                    "shape": query_shape(EXPLAINABLE_COMMANDS[event.command_name](command)),
+                    "route": NO_ROUTE,
+                    "count": 0,
+                    "max_duration_ms": 0.0,
+                    "total_duration_ms": 0.0,
+                    "last_seen": None,
+                    "explain": None
+                }
+            entry["count"] += 1
+            entry["total_duration_ms"] += duration_ms
+            entry["last_seen"] = time.time()
+            if duration_ms > entry["max_duration_ms"]:
+                entry["max_duration_ms"] = duration_ms
+                entry["route"] = stats.route if stats is not None else NO_ROUTE
+                explain = True
+
+            while len(self._entries) > self.max_entries:
+                fastest = min(self._entries, key=lambda other: self._entries[other]["max_duration_ms"])
+                del self._entries[fastest]
+
+        if explain and key in self._entries and self._loop is not None:
+            # An empty context, so that the explain is not attributed to the request in the metrics
+            self._loop.call_soon_threadsafe(self._schedule_explain, key, database_name, command, context=contextvars.Context())
+
+    def _schedule_explain(self, key, database_name: str, command: dict):
+        task = asyncio.ensure_future(self._explain(key, database_name, command))
+        self._explains.add(task)
+        task.add_done_callback(self._explains.discard)
+
+    async def _explain(self, key, database_name: str, command: dict):
+        explainable = {field: value for field, value in command.items() if field not in DRIVER_FIELDS}
+        try:
+            explain = await self._client[database_name].command({"explain": explainable, "verbosity": "executionStats"})
+        except Exception as error:
+            result = {"error": str(error)}
+        else:
+            execution = find_execution_stats(explain) or {}
+            returned = execution.get("nReturned", 0)
+            result = {
+                "plan": plan_summary(explain),
+                "execution_time_ms": execution.get("executionTimeMillis"),
+                "returned": returned,
+                "docs_examined": execution.get("totalDocsExamined"),
+                "keys_examined": execution.get("totalKeysExamined"),
+                "docs_examined_per_returned": round(execution.get("totalDocsExamined", 0) / max(returned, 1), 2),
+                "keys_examined_per_returned": round(execution.get("totalKeysExamined", 0) / max(returned, 1), 2)
+            }
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]["explain"] = result
+
+    """
+    Slowest recorded shapes, slowest first
+    """
+    def entries(self) -> list:
+        with self._lock:
+            return sorted((dict(entry) for entry in self._entries.values()), key=lambda entry: entry["max_duration_ms"], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+slow_queries = SlowQueryProfiler(settings.profiler_enabled, settings.profiler_threshold_ms, settings.profiler_max_entries)
@@ -0,0 +1,54 @@
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+"""
+Fields of a user that can be selected with fields=, in the order of the response
+"""
+USER_FIELDS = ("name", "email", "organizations")
+
+"""
+Fields of an organization that can be selected with fields=, in the order of the response
+"""
+ORGANIZATION_FIELDS = ("name", "created_by", "member_count")
+
+"""
+    Parse a comma separated fields= parameter into the selected fields, in response order.
+    The id is always returned, so "id" and "_id" are accepted and ignored.
+
+    Raises:
+        HTTPException: Unknown field error
+
+    Returns:
+        _type_: List[str] or None when every field is selected
+"""
+def parse_fields(fields: Optional[str], allowed: Tuple[str, ...]) -> Optional[List[str]]:
+    if not fields:
+        return None
+
+    selected = {field.strip() for field in fields.split(",")} - {"", "id", "_id"}
+    unknown = selected - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Valid fields are: {', '.join(allowed)}"
+        )
+    return [field for field in allowed if field in selected]
+
+"""
+    Mongo projection for the selected fields, with $slice on the embedded array when it is limited.
+    extra_fields are read but not returned, e.g. the sort key that the pagination cursor is built from.
+
+    Returns:
+        _type_: dict or None when the whole document is needed
+"""
+def build_projection(fields: Optional[List[str]], array_field: Optional[str] = None, array_limit: Optional[int] = None, extra_fields: Iterable[str] = ()) -> Optional[dict]:
+    if fields is None and array_limit is None:
+        return None
+
+    projection = {}
+    if fields is not None:
+        projection = {field: 1 for field in [*fields, *extra_fields]}
+    if array_field is not None and array_limit is not None and (fields is None or array_field in fields):
+        projection[array_field] = {"$slice": array_limit}
+    return projection
@@ -0,0 +1,75 @@
+import re
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from .. models import SearchMode
+
+"""
+Field holding the lowercased name of users and organizations, backing the indexed prefix search
+"""
+NORMALIZED_NAME_FIELD = "name_lower"
+
+"""
+Normalized form of a name, stored on every write and used for prefix searches
+"""
+def normalize_name(name: str) -> str:
+    return name.lower()
+
+"""
+Add the normalized name field to a document that is to be inserted
+"""
+def with_normalized_name(document: dict) -> dict:
+    document[NORMALIZED_NAME_FIELD] = normalize_name(document["name"])
+    return document
+
+"""
+    Build the filter for a name search. User input is always escaped, never run as a regex.
+        - contains: case-insensitive substring match, scans the collection
+        - prefix: anchored match on the normalized name, bounded by its index
+        - text: word match on the text index, ordered by relevance
+    
+    Returns:
+        _type_: dict
+"""
+def name_query(name: str, mode: SearchMode) -> dict:
+    if mode == SearchMode.TEXT:
+        return {"$text": {"$search": name}}
+    if mode == SearchMode.PREFIX:
+        return {NORMALIZED_NAME_FIELD: {"$regex": "^" + re.escape(normalize_name(name))}}
+    return {"name": {"$regex": re.escape(name), "$options": "i"}}
+
+"""
+    Fetch a page of a text search, ordered by relevance. Text searches are paginated by offset only.
+
+    Returns:
+        _type_: dict with documents, next_cursor and prev_cursor
+"""
+async def text_search_page(collection, query: dict, limit: int, offset: int = 0, projection: Optional[dict] = None) -> dict:
+    score = {**(projection or {}), "score": {"$meta": "textScore"}}
+    documents = await collection\
+                    .find(query, score)\
+                    .sort([("score", {"$meta": "textScore"})])\
+                    .skip(offset)\
+                    .limit(limit)\
+                    .to_list(length=limit)
+    return {"documents": documents, "next_cursor": None, "prev_cursor": None}
+
+"""
+Set the normalized name on the documents written before it existed, in batches
+"""
+async def backfill_normalized_names(collection, batch_size: int = 1000) -> int:
+    updated = 0
+    while True:
+        documents = await collection\
+                        .find({NORMALIZED_NAME_FIELD: {"$exists": False}}, {"name": 1})\
+                        .limit(batch_size)\
+                        .to_list(length=batch_size)
+        if not documents:
+            return updated
+
+        await collection.bulk_write([
+            UpdateOne({"_id": document["_id"]}, {"$set": {NORMALIZED_NAME_FIELD: normalize_name(document.get("name") or "")}})
+            for document in documents
+        ], ordered=False)
+        updated += len(documents)
@@ -0,0 +1,107 @@
+from typing import Callable, List, Optional
+
+import orjson
+from bson import ObjectId
+from fastapi import status
+from fastapi.responses import Response
+
+from .. config import settings
+
+"""
+    Fast serialization path of the responses.
+
+    The payload builders produce the same keys, in the same order, as the response_model path
+    (UserResponse, OrganizationResponse and their list schemas serialized by FastAPI), straight from
+    the raw Motor documents and without validating them again. Internal fields such as name_lower
+    are left out just like the response models do, and a sparse fieldset (fields=) keeps only the
+    selected fields and the id. Expanded relations (expand=) are not part of the response models
+    either, and are only returned by this path. The result is encoded with orjson, which handles ObjectId through
+    _default, and matches the JSONResponse output byte for byte.
+"""
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+"""
+Converters of each field of the responses, in response order
+"""
+USER_CONVERTERS = {
+    "name": lambda document: document["name"],
+    "email": lambda document: document["email"],
+    "organizations": lambda document: document.get("organizations", [])
+}
+
+ORGANIZATION_CONVERTERS = {
+    "name": lambda document: document["name"],
+    "created_by": lambda document: document["created_by"],
+    "member_count": lambda document: document.get("member_count", 0)
+}
+
+def _payload(document: dict, converters: dict, fields: Optional[List[str]]) -> dict:
+    payload = {field: convert(document) for field, convert in converters.items() if fields is None or field in fields}
+    payload["_id"] = document["_id"]
+    return payload
+
+def user_payload(document: dict, fields: Optional[List[str]] = None) -> dict:
+    return _payload(document, USER_CONVERTERS, fields)
+
+def organization_payload(document: dict, fields: Optional[List[str]] = None) -> dict:
+    payload = _payload(document, ORGANIZATION_CONVERTERS, fields)
+    if "members" in document:
+        payload["members"] = document["members"]
+    return payload
+
+def users_payload(content: dict, fields: Optional[List[str]] = None) -> dict:
+    return {
+        "total_count": content.get("total_count"),
+        "users": [user_payload(document, fields) for document in content["users"]],
+        "next_cursor": content.get("next_cursor"),
+        "prev_cursor": content.get("prev_cursor")
+    }
+
+def organizations_payload(content: dict, fields: Optional[List[str]] = None) -> dict:
+    return {
+        "total_count": content.get("total_count"),
+        "organizations": [organization_payload(document, fields) for document in content["organizations"]],
+        "next_cursor": content.get("next_cursor"),
+        "prev_cursor": content.get("prev_cursor")
+    }
+
+def users_lookup_payload(content: dict, fields: Optional[List[str]] = None) -> dict:
+    return {
+        "results": {key: user_payload(document, fields) for key, document in content["results"].items()},
+        "missing": content["missing"]
+    }
+
+def organizations_lookup_payload(content: dict, fields: Optional[List[str]] = None) -> dict:
+    return {
+        "results": {key: organization_payload(document, fields) for key, document in content["results"].items()},
+        "missing": content["missing"]
+    }
+
+def members_payload(content: dict, fields: Optional[List[str]] = None) -> dict:
+    return {
+        "members": [{"user_id": member["user_id"], "access_level": member["access_level"]} for member in content["members"]],
+        "next_cursor": content.get("next_cursor")
+    }
+
+"""
+JSON response of an already built payload, encoded with orjson
+"""
+def json_response(payload, status_code: int = status.HTTP_200_OK) -> Response:
+    return Response(content=orjson.dumps(payload, default=_default), status_code=status_code, media_type="application/json")
+
+"""
+Return the content as is, to be validated by the response_model of the route, or as a fast JSON response
+when fast_serialization is enabled. Sparse fieldsets and expanded relations do not match the response models and always take the fast path.
+The headers set on the injected response, e.g. the ETag, are kept on both paths.
+"""
+def render(content, build_payload: Callable[..., dict], status_code: int = status.HTTP_200_OK, fields: Optional[List[str]] = None, expanded: bool = False, response: Optional[Response] = None):
+    if fields is None and not expanded and not settings.fast_serialization:
+        return content
+    fast_response = json_response(build_payload(content, fields), status_code)
+    if response is not None:
+        fast_response.headers.update(response.headers)
+    return fast_response
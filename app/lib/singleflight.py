@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from pymongo.errors import ExecutionTimeout
+
+from . deadlines import request_deadline
+
+"""
+    Coalesce concurrent identical reads into a single in-flight query.
+
+    The first caller for a key starts the query, every caller arriving while it runs awaits the same
+    future instead of sending its own. The query runs in its own task, so a caller that is cancelled
+    (e.g. a client that went away) does not cancel it for the others.
+
+    The task starts from an empty context, so the query is bound neither by the deadline of the caller
+    that started it nor counted in its request metrics. Each caller only waits for it until its own
+    deadline, and then fails with an ExecutionTimeout, answered with 504 like any query that runs out
+    of the deadline.
+"""
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.requests = 0
+        self.executed = 0
+        self.collapsed = 0
+        self._calls = {}
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Nobody may be left to await a failed query, mark its exception as retrieved
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.requests += 1
+        task = self._calls.get(key)
+        if task is None:
+            self.executed += 1
+            task = contextvars.Context().run(asyncio.ensure_future, fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.collapsed += 1
+
+        deadline = request_deadline.get()
+        if deadline is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise ExecutionTimeout("The request deadline was exceeded while waiting for a shared query", 50)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "executed": self.executed,
+            "collapsed": self.collapsed,
+            "in_flight": len(self._calls)
+        }
+
+"""
+Shared coalescing layer of the find_one lookups, keyed by (collection, field, value)
+"""
+lookups = SingleFlight("lookups")
@@ -0,0 +1,30 @@
+from typing import Any, Awaitable, Callable
+
+from . consistency import CausalDatabase
+
+"""
+Transactions need a replica set or a sharded cluster, a standalone server runs the same writes without one
+"""
+def supports_transactions(client) -> bool:
+    return client.topology_description.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+
+"""
+    Run a sequence of reads and writes in a transaction when the server supports them, or as is on a standalone server.
+
+    writes receives the session to pass to every operation, None without a transaction. It may be run
+    again on a transient error, and an exception it raises, e.g. an HTTPException, aborts the transaction.
+    Two transactions writing the same document conflict, so sequences that all write the organization
+    document are serialized, along with the reads they based their writes on.
+
+    Returns:
+        _type_: the result of writes
+"""
+async def run_in_transaction(db, writes: Callable[[Any], Awaitable[Any]]) -> Any:
+    if not supports_transactions(db.client):
+        return await writes(None)
+
+    async with await db.client.start_session() as session:
+        result = await session.with_transaction(writes)
+    if isinstance(db, CausalDatabase):
+        db.clock.observe(session)
+    return result
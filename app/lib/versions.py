@@ -0,0 +1,73 @@
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+
+"""
+Field holding the version of users and organizations, set to 1 on insert and incremented by every write.
+Documents written before it have no version, which counts as version 0.
+"""
+VERSION_FIELD = "version"
+
+"""
+Set the first version on a document that is to be inserted
+"""
+def with_version(document: dict) -> dict:
+    document[VERSION_FIELD] = 1
+    return document
+
+"""
+Add the version increment to an update document, next to its other operators
+"""
+def bump_version(update: dict) -> dict:
+    return {**update, "$inc": {**update.get("$inc", {}), VERSION_FIELD: 1}}
+
+"""
+Strong ETag of a document, from its id and version
+"""
+def etag(document: dict) -> str:
+    return f'"{document["_id"]}-{document.get(VERSION_FIELD, 0)}"'
+
+"""
+Check an If-None-Match or If-Match header, i.e. "*" or a comma separated list of ETags, against an ETag.
+With weak comparison, for If-None-Match, weak ETags (W/"...") compare equal to their strong form.
+With strong comparison, for If-Match, they never match.
+"""
+def etag_matches(header: str, tag: str, weak: bool = True) -> bool:
+    tags = [candidate.strip() for candidate in header.split(",")]
+    if not weak:
+        return "*" in tags or tag in tags
+    return "*" in tags or tag in [candidate[2:] if candidate.startswith("W/") else candidate for candidate in tags]
+
+"""
+Filter matching a document at the given version, including the documents written before versions existed for version 0
+"""
+def version_filter(_id: ObjectId, version: int) -> dict:
+    if version == 0:
+        return {"_id": _id, VERSION_FIELD: {"$in": [0, None]}}
+    return {"_id": _id, VERSION_FIELD: version}
+
+"""
+    Claim the version of a document that was just read, for an If-Match header, before any other write.
+
+    The header is compared with the version that was read, then that version is claimed with one
+    conditional increment filtered on it, see version_filter, so that of two concurrent writers sending
+    the same ETag only one proceeds. The claim is the version bump of the write, the writes that follow
+    must not bump it again. Without the header nothing is checked nor claimed.
+
+    Raises:
+        HTTPException: Precondition failed error
+
+    Returns:
+        _type_: bool, whether the version was claimed
+"""
+async def claim_version(collection, document: dict, if_match: Optional[str], session=None) -> bool:
+    if not if_match:
+        return False
+
+    if etag_matches(if_match, etag(document), weak=False):
+        result = await collection.update_one(version_filter(document["_id"], document.get(VERSION_FIELD, 0)), {"$inc": {VERSION_FIELD: 1}}, session=session)
+        if result.modified_count == 1:
+            return True
+
+    raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="The resource was modified, its ETag no longer matches If-Match")
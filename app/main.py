@@ -1,27 +1,59 @@
 from fastapi import FastAPI
+from fastapi.exceptions import HTTPException
+from pymongo.errors import PyMongoError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
-from .routers import users, organizations
-from .database import connect_to_db
+from .routers import users, organizations, metrics, admin
+from .database import connect_to_db, close_db_connection
+from .lib.deletions import resume_organization_deletions
+from .lib.metrics import MetricsMiddleware
+from .lib.deadlines import DeadlineMiddleware, http_exception_with_deadline_handler, mongo_error_handler
+from .lib.admission import AdmissionMiddleware
+from .lib.invalidation import cache_invalidator
+from .lib.consistency import CAUSAL_TOKEN_HEADER
+from .database import db_is_available
 
 """FastAPI Instance"""
 app = FastAPI()
 
-"""MiddleWare"""
+"""MiddleWare, the last one added runs first"""
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=['*'],
-    allow_methods=['*']
+    allow_methods=['*'],
+    allow_headers=['If-Match', 'If-None-Match', CAUSAL_TOKEN_HEADER],
+    expose_headers=['ETag', 'Retry-After', CAUSAL_TOKEN_HEADER]
 )
+app.add_middleware(MetricsMiddleware)
+
+"""Exception Handlers"""
+app.add_exception_handler(HTTPException, http_exception_with_deadline_handler)
+app.add_exception_handler(PyMongoError, mongo_error_handler)
 
 """All the Routes"""
 app.include_router(users.router)
 app.include_router(organizations.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 """Database Connection"""
 @app.on_event("startup")
 async def startup_db_client():
-    await connect_to_db()
+    database = await connect_to_db()
+    cache_invalidator.start(database)
+    await resume_organization_deletions(database)
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    await cache_invalidator.stop()
+    await close_db_connection()
+
+"""GET Method - Health, exempt from admission control"""
+@app.get("/health")
+async def health():
+    return {"status": "ok", "database": db_is_available()}
 
 """GET Method - Root"""
 @app.get("/")
@@ -0,0 +1,43 @@
+"""
+Apply the migrations of the database: indexes, backfills and schema changes, recorded in the _migrations collection.
+
+Run it once per deployment, before the API starts, which only checks that the migrations are current.
+Safe to run while a previous version of the API is serving, and to run again after an interruption.
+
+    python -m app.migrate
+    python -m app.migrate --status
+    python -m app.migrate --target 2 --batch-size 1000
+"""
+import argparse
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from .config import settings
+from .database import client_options
+from .lib.migrations import LATEST_VERSION, MIGRATIONS, MIGRATIONS_COLLECTION, apply_migrations, current_version
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="List the migrations and whether they are applied, without applying them")
+    parser.add_argument("--target", type=int, default=LATEST_VERSION, help="Last migration to apply")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents written per batch by the backfills")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.database_hostname, settings.database_port, **client_options())
+    try:
+        database = client[settings.database_name]
+        if args.status:
+            applied = {migration["_id"]: migration async for migration in database[MIGRATIONS_COLLECTION].find()}
+            for migration in MIGRATIONS:
+                state = f"applied in {applied[migration.version]['duration_seconds']}s" if migration.version in applied else "pending"
+                print(f"{migration.version}: {migration.description} ({state})")
+            return
+
+        applied = await apply_migrations(database, args.target, args.batch_size)
+        print(f"Applied {len(applied)} migrations, database is at migration {await current_version(database)} of {LATEST_VERSION}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -25,4 +25,37 @@ Access level for an organization member (Enum)
 class AccessLevel(str, Enum):
     READ = "READ"
     WRITE = "WRITE"
-    ADMIN = "ADMIN"
\ No newline at end of file
+    ADMIN = "ADMIN"
+
+"""
+Sort order for paginated list endpoints (Enum)
+"""
+class SortField(str, Enum):
+    ID = "id"
+    NAME = "name"
+
+
+"""
+How the total count of a filtered list is computed (Enum)
+"""
+class TotalCount(str, Enum):
+    EXACT = "exact"
+    CACHED = "cached"
+    ESTIMATED = "estimated"
+
+
+"""
+File format of an export (Enum)
+"""
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+"""
+How the name filter of a list is matched (Enum)
+"""
+class SearchMode(str, Enum):
+    CONTAINS = "contains"
+    PREFIX = "prefix"
+    TEXT = "text"
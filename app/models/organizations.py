@@ -43,10 +43,28 @@ class MemberPermissionModel(BaseModel):
         }
 
 """
-Organization model
+Membership of a user in an organization, stored in the memberships collection
+"""
+class MembershipModel(MemberPermissionModel):
+    org_id: PyObjectId = Field(...)
+    
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+        schema_extra = {
+            "example": {
+                "org_id": "organization_id",
+                "user_id": "user_id",
+                "access_level": "ADMIN"
+            }
+        }
+
+"""
+Organization model, its members are stored in the memberships collection
 """
 class OrganizationModel(OrganizationBaseModel):
-    members: List[MemberPermissionModel] = Field([], description="List of users in the organization")
+    member_count: int = Field(0, description="Number of users in the organization")
     
     class Config:
         allow_population_by_field_name = True
@@ -55,7 +73,7 @@ class OrganizationModel(OrganizationBaseModel):
         schema_extra = {
             "example": {
                 "name": "Organization name",
-                "members": ["user_id"]
+                "member_count": 1
             }
         }
 
@@ -106,4 +124,37 @@ class RemoveMemberModel(BaseModel):
             "example": {
                 "user_id": "user_id"
             }
+        }
+
+"""
+Model for a batch of member changes that are to be applied to an organization in one request
+"""
+class BatchMembersModel(BaseModel):
+    add: List[AddMemberModel] = Field([], description="Members to add to the organization")
+    update: List[UpdateMemberModel] = Field([], description="Members whose access level is to be updated")
+    remove: List[RemoveMemberModel] = Field([], description="Members to remove from the organization")
+    
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+        schema_extra = {
+            "example": {
+                "add": [{"user_id": "user_id", "access_level": "READ"}],
+                "update": [{"user_id": "user_id", "access_level": "WRITE"}],
+                "remove": [{"user_id": "user_id"}]
+            }
+        }
+
+"""
+Request model for resolving many organizations at once by ID or name
+"""
+class OrganizationLookupModel(BaseModel):
+    keys: List[str] = Field(..., description="Organization IDs and names to resolve")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "keys": ["5f9f1b9b9c9d1b1b8c8c8c8c", "Organization name"]
+            }
         }
\ No newline at end of file
@@ -23,6 +23,19 @@ class UserBaseModel(BaseModel):
             }
         }
 
+"""
+Request model for resolving many users at once by ID or email
+"""
+class UserLookupModel(BaseModel):
+    keys: List[str] = Field(..., description="User IDs and emails to resolve")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "keys": ["5f9f1b9b9c9d1b1b8c8c8c8c", "jdoe@example.com"]
+            }
+        }
+
 """
 Response model for a list of users
 """
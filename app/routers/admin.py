@@ -0,0 +1,37 @@
+from fastapi import APIRouter, status
+
+from .. lib.profiler import slow_queries
+
+router = APIRouter(
+    tags=["Admin"],
+    prefix="/admin",
+)
+
+"""
+    Get method for the slowest Mongo query shapes recorded by the slow-query profiler.
+    
+    Each entry holds the filter shape with its values normalized away, how often and how slowly it
+    ran, the route that issued its slowest run and the explain("executionStats") of that run,
+    including the documents and keys examined per document returned.
+    
+    Returns:
+        _type_: enabled, threshold_ms
+        _type_: List[SlowQuery]
+"""
+@router.get("/slow-queries", response_description="Slowest Mongo queries", status_code=status.HTTP_200_OK)
+async def get_slow_queries():
+    return {
+        "enabled": slow_queries.enabled,
+        "threshold_ms": slow_queries.threshold_ms,
+        "queries": slow_queries.entries()
+    }
+
+"""
+    Delete method for clearing the queries recorded by the slow-query profiler.
+    
+    Returns:
+        _type_: None
+"""
+@router.delete("/slow-queries", response_description="Clear the slowest Mongo queries", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_slow_queries():
+    slow_queries.clear()
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, status
+from fastapi.responses import PlainTextResponse
+
+from .. lib.metrics import registry
+from .. lib.cache import user_cache, organization_cache
+from .. lib.singleflight import lookups
+from .. lib.admission import limiters
+from .. lib.coalescing import user_inserts
+from .. lib.invalidation import cache_invalidator
+
+router = APIRouter(
+    tags=["Metrics"],
+)
+
+"""
+Samples of the read-through caches, of the lookup and insert coalescing and of the admission control, in the format expected by MetricsRegistry.render
+"""
+def component_samples() -> list:
+    caches = [cache.stats() for cache in (user_cache, organization_cache)]
+    coalescing = lookups.stats()
+    inserts = user_inserts.stats()
+    invalidation = cache_invalidator.stats()
+    return [
+        ("cache_hits_total", "counter", "Read-through cache hits", ("cache",), {(cache["name"],): cache["hits"] for cache in caches}),
+        ("cache_misses_total", "counter", "Read-through cache misses", ("cache",), {(cache["name"],): cache["misses"] for cache in caches}),
+        ("cache_evictions_total", "counter", "Read-through cache evictions", ("cache",), {(cache["name"],): cache["evictions"] for cache in caches}),
+        ("cache_size", "gauge", "Documents held by the read-through cache", ("cache",), {(cache["name"],): cache["size"] for cache in caches}),
+        ("cache_invalidation_connected", "gauge", "Whether the change stream invalidating the caches is open", ("consumer",), {(invalidation["name"],): int(invalidation["connected"])}),
+        ("cache_invalidation_events_total", "counter", "Changes applied to the caches", ("consumer",), {(invalidation["name"],): invalidation["events"]}),
+        ("cache_invalidation_restarts_total", "counter", "Restarts of the change stream invalidating the caches", ("consumer",), {(invalidation["name"],): invalidation["restarts"]}),
+        ("singleflight_requests_total", "counter", "Lookups requested", ("group",), {(coalescing["name"],): coalescing["requests"]}),
+        ("singleflight_collapsed_total", "counter", "Lookups served by an identical in-flight query", ("group",), {(coalescing["name"],): coalescing["collapsed"]}),
+        ("singleflight_in_flight", "gauge", "Lookups being executed", ("group",), {(coalescing["name"],): coalescing["in_flight"]}),
+        ("insert_coalescer_batches_total", "counter", "Batches written by the insert coalescer", ("collection",), {(inserts["name"],): inserts["batches"]}),
+        ("insert_coalescer_documents_total", "counter", "Documents written by the insert coalescer", ("collection",), {(inserts["name"],): inserts["documents"]}),
+        ("insert_coalescer_counter_failures_total", "counter", "Failed list counter updates of the insert coalescer, whose documents were inserted", ("collection",), {(inserts["name"],): inserts["counter_failures"]}),
+        ("insert_coalescer_pending", "gauge", "Documents waiting for the next batch of the insert coalescer", ("collection",), {(inserts["name"],): inserts["pending"]}),
+        ("admission_active", "gauge", "Requests admitted and running, by route class", ("route_class",), {(name,): limiter.active for name, limiter in limiters.items()}),
+        ("admission_queued", "gauge", "Requests waiting to be admitted, by route class", ("route_class",), {(name,): limiter.queued for name, limiter in limiters.items()})
+    ]
+
+"""
+    Get method for the metrics of the API in the Prometheus text format.
+    
+    Returns:
+        _type_: text/plain
+"""
+@router.get("/metrics", response_description="Prometheus metrics", status_code=status.HTTP_200_OK, response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(component_samples()), media_type="text/plain; version=0.0.4; charset=utf-8")
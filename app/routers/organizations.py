@@ -1,12 +1,32 @@
-from fastapi import APIRouter, HTTPException, status, Body
-from pymongo.errors import DuplicateKeyError, ConnectionFailure
+from fastapi import APIRouter, HTTPException, status, Body, Query, Depends, Response, Header
+from fastapi.responses import StreamingResponse
+from pymongo import InsertOne, UpdateMany, DeleteMany
+from pymongo.errors import DuplicateKeyError, ConnectionFailure, BulkWriteError
 from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from .. lib.validators import validate_string_fields, validate_db_connection, validate_organization_role
+from .. lib.validators import validate_string_fields, validate_organization_role
 from .. lib.helper_functions import get_access_level_enum
-from .. database import connect_to_db
-from .. models.organizations import OrganizationBaseModel, OrganizationModel, MemberPermissionModel, AddMemberModel, UpdateMemberModel, RemoveMemberModel
-from .. schemas.organizations import OrganizationResponse, OrganizationsResponse
+from .. lib.pagination import paginate, encode_cursor, decode_cursor
+from .. lib.search import name_query, text_search_page, with_normalized_name
+from .. lib.counters import get_total_count, increment_total
+from .. lib.export import export_response, organization_record, ORGANIZATION_COLUMNS
+from .. lib.cache import user_cache, organization_cache
+from .. lib.singleflight import lookups
+from .. lib.lookups import bulk_lookup
+from .. lib.projections import parse_fields, build_projection, ORGANIZATION_FIELDS
+from .. lib.serializers import render, organization_payload, organizations_payload, organizations_lookup_payload, members_payload
+from .. lib.memberships import MEMBERSHIPS_COLLECTION, get_organization_as_admin, update_organization_members, plan_member_batch
+from .. lib.expansions import parse_expand, expand_members, ORGANIZATION_EXPANSIONS
+from .. lib.deletions import delete_organization_with_members, start_organization_deletion, schedule_organization_cleanup
+from .. lib.versions import VERSION_FIELD, with_version, bump_version, etag, etag_matches, claim_version
+from .. config import settings
+from .. lib.consistency import set_causal_token
+from .. lib.transactions import run_in_transaction
+from .. database import get_database, get_read_database, get_write_database
+from .. models import AccessLevel, SortField, TotalCount, ExportFormat, SearchMode
+from .. models.organizations import OrganizationBaseModel, OrganizationModel, MembershipModel, AddMemberModel, UpdateMemberModel, RemoveMemberModel, BatchMembersModel, OrganizationLookupModel
+from .. schemas.organizations import OrganizationResponse, OrganizationsResponse, OrganizationsLookupResponse, OrganizationDeletionResponse, MembersResponse, BatchMembersResponse
 
 router = APIRouter(
     tags=["Organizations"],
@@ -16,6 +36,10 @@ router = APIRouter(
 """
     Post method for creating a new organization.
     
+    The organization, the ADMIN membership of its creator and the creator's organizations list are
+    written in a transaction when the server supports them. Without one, the organization and its
+    membership are deleted again when a later write fails, so that no organization is left without an ADMIN.
+    
     Raises:
         HTTPException: Fields validation error
         HTTPException: Invalid user ID error
@@ -27,14 +51,12 @@ router = APIRouter(
         _type_: Organization
 """
 @router.post("/", response_description="Create new organization", status_code=status.HTTP_201_CREATED, response_model=OrganizationResponse)
-async def create_organization(organization: OrganizationBaseModel = Body(...)):
-    db = await connect_to_db()
-    validate_db_connection(db)
-    
+async def create_organization(response: Response, organization: OrganizationBaseModel = Body(...), db: AsyncIOMotorDatabase = Depends(get_write_database)):
     validate_string_fields(organization.name, organization.created_by, detail="All the field are required")
     
     try:
-        user = await db.users.find_one({"_id": ObjectId(organization.created_by)})
+        user_id = ObjectId(organization.created_by)
+        user = await lookups.do(("users", "_id", user_id), lambda: db.users.find_one({"_id": user_id}))
         
         if user is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invalid user ID")
@@ -49,13 +71,34 @@ async def create_organization(organization: OrganizationBaseModel = Body(...)):
                 detail="Invalid access level. Valid access levels are: ADMIN, WRITE, READ"
             )
         
-        organization.members.append({"user_id": ObjectId(organization.created_by), "access_level": access_level})
+        organization.member_count = 1
+        document = with_version(with_normalized_name(organization.dict()))
         
-        result = await db.organizations.insert_one(organization.dict())
+        async def writes(session):
+            result = await db.organizations.insert_one(dict(document), session=session)
+            try:
+                # The creator is the first member of the organization
+                membership = MembershipModel(org_id=result.inserted_id, user_id=user_id, access_level=access_level)
+                await db[MEMBERSHIPS_COLLECTION].insert_one(membership.dict(), session=session)
+                
+                # Add the organization to the user's organizations list
+                user = await db.users.find_one_and_update({"_id": user_id}, bump_version({"$push": {"organizations": result.inserted_id}}), session=session)
+                if user is None:
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invalid user ID")
+                
+                return await db.organizations.find_one({"_id": result.inserted_id}, session=session)
+            except Exception:
+                # A transaction is aborted instead
+                if session is None:
+                    await db[MEMBERSHIPS_COLLECTION].delete_one({"org_id": result.inserted_id, "user_id": user_id})
+                    await db.organizations.delete_one({"_id": result.inserted_id})
+                raise
         
-        # Add the organization to the user's organizations list
-        await db.users.find_one_and_update({"_id": ObjectId(organization.created_by)}, {"$push": {"organizations": ObjectId(result.inserted_id)}})
-        return await db.organizations.find_one({ "_id": result.inserted_id })
+        organization = await run_in_transaction(db, writes)
+        await increment_total(db, "organizations")
+        user_cache.invalidate(user_id)
+        set_causal_token(response, db)
+        return render(organization, organization_payload, status.HTTP_201_CREATED, response=response)
     
     except DuplicateKeyError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Organization already exists")
@@ -68,42 +111,108 @@ async def create_organization(organization: OrganizationBaseModel = Body(...)):
         
 
 """
-    Get method for getting a list of organizations (filtered by name, and paginated i.e limit and offset).
+    Post method for resolving many organizations at once, by a mixed list of IDs and names.
+    
+    The keys are split into at most two $in queries, one by _id and one by name, and read through
+    the cache when it is enabled. Results are keyed by the requested key, and keys that match no
+    organization are listed in missing.
+    
+    Raises:
+        HTTPException: Empty or too large batch error
+        HTTPException: Internal server error
+    
+    Returns:
+        _type_: Dict[key, Organization]
+        _type_: missing
+"""
+@router.post("/lookup", response_description="Resolve many organizations by ID or name", status_code=status.HTTP_200_OK, response_model=OrganizationsLookupResponse)
+async def lookup_organizations(lookup: OrganizationLookupModel = Body(...), db: AsyncIOMotorDatabase = Depends(get_read_database)):
+    if len(lookup.keys) == 0 or len(lookup.keys) > settings.max_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A lookup must contain between 1 and {settings.max_batch_size} keys"
+        )
+    
+    try:
+        return render(await bulk_lookup(db.organizations, organization_cache, "name", lookup.keys), organizations_lookup_payload)
+    
+    except ConnectionFailure:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to look up organizations."
+        )
+        
+"""
+    Get method for getting a list of organizations (filtered by name, and paginated).
+    
+    Pages are addressed with the opaque after/before cursors returned as next_cursor/prev_cursor,
+    sorted by id or by (name, id). Offset pagination is still available but capped.
+    expand=members adds the first members of each organization along with their name and email,
+    the users of the whole page being read with a single query.
     
     Raises:
+        HTTPException: Invalid pagination parameters error
+        HTTPException: Unknown field or relation error
         HTTPException: No organizations found error
         HTTPException: Internal server error
     
     Returns:
         _type_: List[Organization]
-        _type_: Organization
+        _type_: next_cursor, prev_cursor
 """
 @router.get("/", response_description="List all organizations", status_code=status.HTTP_200_OK, response_model=OrganizationsResponse)
-async def get_organizations(name: str = None, limit: int = 10, offset: int = 0):
-    db = await connect_to_db()
-    validate_db_connection(db)
-    
+async def get_organizations(
+    name: str = None,
+    limit: int = Query(10, ge=1, le=settings.max_page_limit),
+    offset: int = Query(0, ge=0, le=settings.max_page_offset),
+    after: str = None,
+    before: str = None,
+    sort_by: SortField = SortField.ID,
+    search: SearchMode = SearchMode.CONTAINS,
+    include_total: bool = True,
+    count_mode: TotalCount = TotalCount.CACHED,
+    fields: str = None,
+    expand: str = None,
+    db: AsyncIOMotorDatabase = Depends(get_read_database)
+):
     # Query parameters
     query = {}
     if name:
-        query = {"name": {"$regex": name, "$options": "i"}}
+        query = name_query(name, search)
+    
+    # Sparse fieldset, the name is also read when the cursor is built from it
+    selected_fields = parse_fields(fields, ORGANIZATION_FIELDS)
+    expansions = parse_expand(expand, ORGANIZATION_EXPANSIONS)
+    projection = build_projection(selected_fields, extra_fields=["name"] if sort_by == SortField.NAME else [])
         
     try:
         # Pagination
-        total_count = await db.organizations.count_documents(query)
-        result = await db.organizations\
-                        .find(query)\
-                        .skip(offset)\
-                        .limit(limit)\
-                        .to_list(length=limit)
+        total_count = None
+        if include_total:
+            total_count = await get_total_count(db, "organizations", query, count_mode)
+        if name and search == SearchMode.TEXT:
+            if after or before:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Text search is paginated by offset only")
+            page = await text_search_page(db.organizations, query, limit, offset=offset, projection=projection)
+        else:
+            page = await paginate(db.organizations, query, sort_by, limit, offset=offset, after=after, before=before, projection=projection)
+        result = page["documents"]
                         
         if result is None or len(result) == 0:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No Organizations found"
             )
+        
+        if expansions:
+            result = await expand_members(db, result)
                         
-        return {"total_count": total_count, "organizations": result}
+        return render({
+            "total_count": total_count,
+            "organizations": result,
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"]
+        }, organizations_payload, fields=selected_fields, expanded=bool(expansions))
     
     except ConnectionFailure:
         raise HTTPException(
@@ -111,34 +220,80 @@ async def get_organizations(name: str = None, limit: int = 10, offset: int = 0):
             detail="Failed to get organizations."
         )
         
+"""
+    Get method for exporting all the organizations, or the ones filtered by name, as NDJSON or CSV.
+    
+    The response is streamed from a single server-side cursor read in batches of batch_size,
+    so memory stays constant whatever the size of the export.
+    
+    Returns:
+        _type_: StreamingResponse
+"""
+@router.get("/export", response_description="Export organizations", status_code=status.HTTP_200_OK, response_class=StreamingResponse)
+async def export_organizations(
+    name: str = None,
+    search: SearchMode = SearchMode.CONTAINS,
+    format: ExportFormat = ExportFormat.NDJSON,
+    batch_size: int = Query(settings.export_batch_size, ge=1, le=settings.export_max_batch_size),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    # Query parameters
+    query = {}
+    if name:
+        query = name_query(name, search)
+    
+    cursor = db.organizations.find(query, batch_size=batch_size).sort("_id", 1)
+    return export_response(cursor, organization_record, ORGANIZATION_COLUMNS, format, "organizations")
+        
 """
     Get method for retrieving an organization, filtered by ID or name.
+    expand=members adds the first members of the organization along with their name and email.
+    
+    The response carries an ETag of the organization's version. A matching If-None-Match is answered
+    with 304 from a lookup of the version alone, without reading the whole document.
     
     Raises:
+        HTTPException: Unknown field or relation error
         HTTPException: Organization not found error
         HTTPException: Internal server error
     
     Returns:
-        _type_: Organization
+        _type_: Organization, or 304 Not Modified
 """
 @router.get("/{id_or_name}", response_description="Get a single organization", status_code=status.HTTP_200_OK, response_model=OrganizationResponse)
-async def get_organization(id_or_name: str):
-    db = await connect_to_db()
-    validate_db_connection(db)
-    
+async def get_organization(id_or_name: str, response: Response, fields: str = None, expand: str = None, if_none_match: str = Header(None), db: AsyncIOMotorDatabase = Depends(get_database)):
     if(ObjectId.is_valid(id_or_name)):
         query = {"_id": ObjectId(id_or_name)}
     else:
         query = {"name": id_or_name}
         
     try:
-        result = await db.organizations.find_one(query)
+        # Whole documents go through the cache, projections straight to Mongo
+        selected_fields = parse_fields(fields, ORGANIZATION_FIELDS)
+        expansions = parse_expand(expand, ORGANIZATION_EXPANSIONS)
+        projection = build_projection(selected_fields, extra_fields=[VERSION_FIELD])
+        field, value = next(iter(query.items()))
+        
+        # Expanded members are not covered by the version of the organization
+        if if_none_match and not expansions:
+            current = organization_cache.get(field, value) or await db.organizations.find_one(query, {VERSION_FIELD: 1})
+            if current is not None and etag_matches(if_none_match, etag(current)):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag(current)})
+        
+        if projection is None:
+            result = await organization_cache.get_or_load(field, value, lambda: lookups.do(("organizations", field, value), lambda: db.organizations.find_one(query)))
+        else:
+            result = await db.organizations.find_one(query, projection)
         if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Organization not found"
             )
-        return result
+        if expansions:
+            result = (await expand_members(db, [result]))[0]
+        else:
+            response.headers["ETag"] = etag(result)
+        return render(result, organization_payload, fields=selected_fields, expanded=bool(expansions), response=response)
 
     except ConnectionFailure:
         raise HTTPException(
@@ -146,72 +301,131 @@ async def get_organization(id_or_name: str):
             detail="Failed to get organization."
         )
 
+"""
+    Get method for listing the members of an organization, paginated by user ID.
+    
+    Members are read from the (org_id, user_id) index of the memberships collection, so every page
+    costs the same whatever the size of the organization.
+    
+    Raises:
+        HTTPException: Invalid cursor error
+        HTTPException: Organization not found error
+        HTTPException: Internal server error
+    
+    Returns:
+        _type_: List[Member]
+        _type_: next_cursor
+"""
+@router.get("/{organization_id}/members", response_description="List the members of an organization", status_code=status.HTTP_200_OK, response_model=MembersResponse)
+async def get_organization_members(
+    organization_id: str,
+    limit: int = Query(10, ge=1, le=settings.max_page_limit),
+    after: str = None,
+    access_level: AccessLevel = None,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    try:
+        organization_id = ObjectId(organization_id)
+        
+        query = {"org_id": organization_id}
+        if after:
+            query["user_id"] = {"$gt": decode_cursor(after, SortField.ID)[0]}
+        if access_level:
+            query["access_level"] = access_level.value
+        
+        members = await db[MEMBERSHIPS_COLLECTION]\
+                        .find(query, {"_id": 0, "user_id": 1, "access_level": 1})\
+                        .sort("user_id", 1)\
+                        .limit(limit + 1)\
+                        .to_list(length=limit + 1)
+        
+        if not members and await db.organizations.find_one({"_id": organization_id}, {"_id": 1}) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
+        
+        next_cursor = None
+        if len(members) > limit:
+            members = members[:limit]
+            next_cursor = encode_cursor({"_id": members[-1]["user_id"]}, SortField.ID)
+        
+        return render({"members": members, "next_cursor": next_cursor}, members_payload)
+    
+    except ConnectionFailure:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get organization members."
+        )
+
 """
     Post method for adding a new member to an existing organization.
     
+    The membership is inserted in the memberships collection, its unique (org_id, user_id) index
+    rejects duplicate members, and the organization document only gets its member_count bumped.
+    The admin check and the writes run in a transaction when the server supports them.
+    With If-Match, the member is only added if the organization still has that ETag.
+    
     Raises:
         HTTPException: Fields validation error
         HTTPException: Organization not found error
         HTTPException: Invalid user ID error
         HTTPException: Invalid access level error
         HTTPException: Duplicate member error
+        HTTPException: Precondition failed error
         HTTPException: Internal server error
     
     Returns:
         _type_: Organization
 """
 @router.post("/{organization_id}/members/{author_id}", response_description="Add a member to an organization", status_code=status.HTTP_200_OK, response_model=OrganizationResponse)
-async def add_user_to_organization(organization_id: str, author_id: str,  member: AddMemberModel = Body(...)):
-    db = await connect_to_db()
-    validate_db_connection(db)
-    
+async def add_user_to_organization(organization_id: str, author_id: str, response: Response, member: AddMemberModel = Body(...), if_match: str = Header(None), db: AsyncIOMotorDatabase = Depends(get_write_database)):
     user_id, access_level = member.user_id, member.access_level
     
     validate_string_fields(organization_id, author_id, user_id, detail="All the fields are required")
     validate_organization_role(access_level)
     
+    access_level = get_access_level_enum(access_level)
+    if access_level is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid access level. Valid access levels are: ADMIN, WRITE, READ"
+        )
+    
     try:
-        # Check if the organization exists
-        organization = await db.organizations.find_one({"_id": ObjectId(organization_id)})
-        if not organization:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
-        
-        # Check if the user exists
-        user = await db.users.find_one({"_id": ObjectId(user_id)})
-        if user is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
-        # Check if the author is a ADMIN of the organization
-        is_admin = await db.organizations.find_one({"_id": ObjectId(organization_id), "members": {"$elemMatch": {"user_id": ObjectId(author_id), "access_level": "ADMIN"}}})
-        if is_admin is None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Author is not an ADMIN of the organization")
+        organization_id, author_id, user_id = ObjectId(organization_id), ObjectId(author_id), ObjectId(user_id)
+        membership = MembershipModel(org_id=organization_id, user_id=user_id, access_level=access_level)
         
-        # Check if the user is already a member of the organization
-        is_member = await db.organizations.find_one({"_id": ObjectId(organization_id), "members": {"$elemMatch": {"user_id": ObjectId(user_id)}}})
-        if is_member:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists in the organization")
-        
-        access_level = get_access_level_enum(access_level)
-        if access_level is None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid access level. Valid access levels are: ADMIN, WRITE, READ"
+        async def writes(session):
+            # Check if the author is a ADMIN of the organization
+            organization = await get_organization_as_admin(db, organization_id, author_id, session=session)
+            
+            # Optimistic concurrency, the writes only proceed if the organization is still at the version of If-Match, which they claim
+            claimed = await claim_version(db.organizations, organization, if_match, session=session)
+            
+            try:
+                await db[MEMBERSHIPS_COLLECTION].insert_one(membership.dict(), session=session)
+            except DuplicateKeyError:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists in the organization")
+            
+            # Add the organization to the user's organizations list
+            result = await db.users.update_one(
+                {"_id": user_id},
+                bump_version({"$addToSet": {"organizations": organization_id}}),
+                session=session
             )
+            if result.matched_count == 0:
+                # Undo the membership of a user that does not exist, a transaction is aborted instead
+                if session is None:
+                    await db[MEMBERSHIPS_COLLECTION].delete_one({"org_id": organization_id, "user_id": user_id})
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
             
-        member = MemberPermissionModel(**({"user_id": ObjectId(user_id), "access_level": access_level}))
-        
-        await db.organizations.find_one_and_update(
-            {"_id": ObjectId(organization_id)},
-            {"$push": {"members": member.dict()}}
-        )
+            return await update_organization_members(db, organization, {"$inc": {"member_count": 1}}, claimed, [user_id], session=session)
         
-        # Add the organization to the user's organizations list
-        await db.users.find_one_and_update(
-            {"_id": ObjectId(user_id)},
-            {"$push": {"organizations": ObjectId(organization_id)}}
-        )
+        organization = await run_in_transaction(db, writes)
         
-        return await db.organizations.find_one({"_id": ObjectId(organization_id)})
+        organization_cache.set(organization)
+        user_cache.invalidate(user_id)
+        response.headers["ETag"] = etag(organization)
+        set_causal_token(response, db)
+        return render(organization, organization_payload, response=response)
     
     except ConnectionFailure:
         raise HTTPException(
@@ -221,56 +435,61 @@ async def add_user_to_organization(organization_id: str, author_id: str,  member
 
 """
     Patch method for updating a member's access level.
+    The admin check and the writes run in a transaction when the server supports them.
+    With If-Match, the access level is only updated if the organization still has that ETag.
     
     Raises:
         HTTPException: Fields validation error
         HTTPException: Organization not found error
         HTTPException: Invalid access level error
         HTTPException: Member not found error
+        HTTPException: Precondition failed error
         HTTPException: Internal server error
     
     Returns:
         _type_: Organization
 """
 @router.patch("/{organization_id}/members/{author_id}", response_description="Update a member's access level", status_code=status.HTTP_200_OK, response_model=OrganizationResponse)
-async def update_user_access_level(organization_id: str, author_id: str, member: UpdateMemberModel = Body(...)):
-    db = await connect_to_db()
-    validate_db_connection(db)
-    
+async def update_user_access_level(organization_id: str, author_id: str, response: Response, member: UpdateMemberModel = Body(...), if_match: str = Header(None), db: AsyncIOMotorDatabase = Depends(get_write_database)):
     user_id, access_level = member.user_id, member.access_level
     
     validate_string_fields(organization_id, author_id, user_id, detail="All the fields are required")
     validate_organization_role(access_level)
     
+    access_level = get_access_level_enum(access_level)
+    if access_level is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid access level. Valid access levels are: ADMIN, WRITE, READ"
+        )
+    
     try:
-        # Check if the organization exists
-        organization = await db.organizations.find_one({"_id": ObjectId(organization_id)})
-        if not organization:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
+        organization_id, author_id, user_id = ObjectId(organization_id), ObjectId(author_id), ObjectId(user_id)
         
-        # Check if the author is a ADMIN of the organization
-        is_admin = await db.organizations.find_one({"_id": ObjectId(organization_id), "members": {"$elemMatch": {"user_id": ObjectId(author_id), "access_level": "ADMIN"}}})
-        if is_admin is None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Author is not an ADMIN of the organization")
-        
-        # Check if the user is already a member of the organization
-        is_member = await db.organizations.find_one({"_id": ObjectId(organization_id), "members": {"$elemMatch": {"user_id": ObjectId(user_id)}}})
-        if is_member is None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User does not exist in the organization")
-        
-        access_level = get_access_level_enum(access_level)
-        if access_level is None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid access level. Valid access levels are: ADMIN, WRITE, READ"
+        async def writes(session):
+            # Check if the author is a ADMIN of the organization
+            organization = await get_organization_as_admin(db, organization_id, author_id, session=session)
+            
+            # Optimistic concurrency, the writes only proceed if the organization is still at the version of If-Match, which they claim
+            claimed = await claim_version(db.organizations, organization, if_match, session=session)
+            
+            result = await db[MEMBERSHIPS_COLLECTION].update_one(
+                {"org_id": organization_id, "user_id": user_id},
+                {"$set": {"access_level": access_level}},
+                session=session
             )
+            if result.matched_count == 0:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User does not exist in the organization")
             
-        await db.organizations.find_one_and_update(
-            {"_id": ObjectId(organization_id), "members.user_id": ObjectId(user_id)},
-            {"$set": {"members.$.access_level": access_level}}
-        )
+            # The members of the organization changed, so does its version
+            return await update_organization_members(db, organization, {}, claimed, [user_id], session=session)
+        
+        organization = await run_in_transaction(db, writes)
         
-        return await db.organizations.find_one({"_id": ObjectId(organization_id)})
+        organization_cache.set(organization)
+        response.headers["ETag"] = etag(organization)
+        set_causal_token(response, db)
+        return render(organization, organization_payload, response=response)
     
     except ConnectionFailure:
         raise HTTPException(
@@ -281,6 +500,8 @@ async def update_user_access_level(organization_id: str, author_id: str, member:
 
 """
     Delete method for removing a member from an organization.
+    The admin check and the writes run in a transaction when the server supports them.
+    With If-Match, the member is only removed if the organization still has that ETag.
     
     Raises:
         HTTPException: Fields validation error
@@ -288,56 +509,243 @@ async def update_user_access_level(organization_id: str, author_id: str, member:
         HTTPException: Cannot remove the creator of the organization
         HTTPException: Invalid access level error
         HTTPException: Member not found error
+        HTTPException: Precondition failed error
         HTTPException: Internal server error
     
     Returns:
         _type_: Organization
 """
 @router.delete("/{organization_id}/members/{author_id}", response_description="Remove a member from an organization", status_code=status.HTTP_200_OK, response_model=OrganizationResponse)
-async def remove_user_from_organization(organization_id: str, author_id: str, member: RemoveMemberModel = Body(...)):
-    db = await connect_to_db()
-    validate_db_connection(db)
-    
+async def remove_user_from_organization(organization_id: str, author_id: str, response: Response, member: RemoveMemberModel = Body(...), if_match: str = Header(None), db: AsyncIOMotorDatabase = Depends(get_write_database)):
     user_id = member.user_id
     
     validate_string_fields(organization_id, author_id, user_id, detail="All the fields are required")
     
     try:
-        # Check if the organization exists
-        organization = await db.organizations.find_one({"_id": ObjectId(organization_id)})
-        if not organization:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
-        
-        # Security check - Check if the member is the person who created the organization
-        is_creator = organization["created_by"] == ObjectId(user_id)
-        if is_creator:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot remove the creator of the organization")
+        organization_id, author_id, user_id = ObjectId(organization_id), ObjectId(author_id), ObjectId(user_id)
         
-        # Check if the author is a ADMIN of the organization
-        is_admin = await db.organizations.find_one({"_id": ObjectId(organization_id), "members": {"$elemMatch": {"user_id": ObjectId(author_id), "access_level": "ADMIN"}}})
-        if is_admin is None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Author is not an ADMIN of the organization")
+        async def writes(session):
+            # Check if the organization exists and the author is a ADMIN of it
+            organization = await get_organization_as_admin(db, organization_id, author_id, session=session)
+            
+            # Security check - Check if the member is the person who created the organization
+            if organization["created_by"] == user_id:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot remove the creator of the organization")
+            
+            # Optimistic concurrency, the writes only proceed if the organization is still at the version of If-Match, which they claim
+            claimed = await claim_version(db.organizations, organization, if_match, session=session)
+            
+            result = await db[MEMBERSHIPS_COLLECTION].delete_one({"org_id": organization_id, "user_id": user_id}, session=session)
+            if result.deleted_count == 0:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User does not exist in the organization")
+            
+            # Remove the organization from the user's organizations list
+            await db.users.update_one(
+                {"_id": user_id},
+                bump_version({"$pull": {"organizations": organization_id}}),
+                session=session
+            )
+            
+            return await update_organization_members(db, organization, {"$inc": {"member_count": -1}}, claimed, [user_id], session=session)
         
-        # Check if the user is a member of the organization
-        is_member = await db.organizations.find_one({"_id": ObjectId(organization_id), "members": {"$elemMatch": {"user_id": ObjectId(user_id)}}})
-        if is_member is None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User does not exist in the organization")
+        organization = await run_in_transaction(db, writes)
         
-        await db.organizations.find_one_and_update(
-            {"_id": ObjectId(organization_id)},
-            {"$pull": {"members": {"user_id": ObjectId(user_id)}}}
+        organization_cache.set(organization)
+        user_cache.invalidate(user_id)
+        response.headers["ETag"] = etag(organization)
+        set_causal_token(response, db)
+        return render(organization, organization_payload, response=response)
+    
+    except ConnectionFailure:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to remove user from organization."
         )
+
+
+"""
+    Post method for adding, updating and removing many members of an organization in one request.
+    
+    The users to add and the current memberships of the batch users are each read with a single $in
+    query, then the memberships and the users' organizations lists are each changed with one
+    bulk_write. Every operation gets its own result, invalid operations are reported and skipped
+    without failing the whole batch, and so are the operations whose write fails. Only the writes that
+    succeeded are mirrored in the users' organizations lists and the member_count. When the server supports
+    transactions, the admin check, the reads and the writes run in one, and a failed write fails the request.
+    With If-Match, the batch is only applied if the organization still has that ETag, and the response
+    carries the new ETag.
+    
+    Raises:
+        HTTPException: Empty or too large batch error
+        HTTPException: Organization not found error
+        HTTPException: Author is not an ADMIN error
+        HTTPException: Precondition failed error
+        HTTPException: Internal server error
+    
+    Returns:
+        _type_: organization_id
+        _type_: List[MemberOperationResult]
+"""
+@router.post("/{organization_id}/members/{author_id}/batch", response_description="Add, update and remove many members of an organization", status_code=status.HTTP_200_OK, response_model=BatchMembersResponse)
+async def batch_update_members(organization_id: str, author_id: str, response: Response, batch: BatchMembersModel = Body(...), if_match: str = Header(None), db: AsyncIOMotorDatabase = Depends(get_write_database)):
+    validate_string_fields(organization_id, author_id, detail="All the fields are required")
+    
+    size = len(batch.add) + len(batch.update) + len(batch.remove)
+    if size == 0 or size > settings.max_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch must contain between 1 and {settings.max_batch_size} operations"
+        )
+    
+    try:
+        organization_id, author_id = ObjectId(organization_id), ObjectId(author_id)
+        user_ids = [ObjectId(item.user_id) for item in batch.add + batch.update + batch.remove]
+        
+        async def writes(session):
+            organization = await get_organization_as_admin(db, organization_id, author_id, session=session)
+            
+            # Optimistic concurrency, the writes only proceed if the organization is still at the version of If-Match, which they claim
+            claimed = await claim_version(db.organizations, organization, if_match, session=session)
+            
+            # Current memberships of the batch users, and the users to add, each with a single query
+            memberships = db[MEMBERSHIPS_COLLECTION].find({"org_id": organization_id, "user_id": {"$in": user_ids}}, {"user_id": 1, "access_level": 1}, session=session)
+            members = {membership["user_id"]: membership["access_level"] async for membership in memberships}
+            
+            existing_user_ids = set()
+            if batch.add:
+                users = db.users.find({"_id": {"$in": [ObjectId(item.user_id) for item in batch.add]}}, {"_id": 1}, session=session)
+                existing_user_ids = {user["_id"] async for user in users}
+            
+            results, members_to_add, updates_by_access_level, user_ids_to_remove = plan_member_batch(batch, organization["created_by"], members, existing_user_ids)
+            
+            # Every write is planned from the memberships read above, and written users are only mirrored once their write succeeded
+            membership_writes = [InsertOne(MembershipModel(org_id=organization_id, **member).dict()) for member in members_to_add]
+            written = [("add", [member["user_id"]]) for member in members_to_add]
+            for access_level, ids in updates_by_access_level.items():
+                membership_writes.append(UpdateMany({"org_id": organization_id, "user_id": {"$in": ids}}, {"$set": {"access_level": access_level}}))
+                written.append(("update", ids))
+            if user_ids_to_remove:
+                membership_writes.append(DeleteMany({"org_id": organization_id, "user_id": {"$in": user_ids_to_remove}}))
+                written.append(("remove", user_ids_to_remove))
+            
+            added_user_ids = [member["user_id"] for member in members_to_add]
+            removed_count = 0
+            if membership_writes:
+                try:
+                    result = await db[MEMBERSHIPS_COLLECTION].bulk_write(membership_writes, ordered=False, session=session)
+                    removed_count = result.deleted_count
+                except BulkWriteError as error:
+                    # A failed write aborts a transaction, whose reads already rule out concurrent changes
+                    if session is not None:
+                        raise
+                    
+                    # Report the operations that failed, e.g. members added first by a concurrent request, and keep the others
+                    removed_count = error.details["nRemoved"]
+                    failed = {}
+                    for write_error in error.details["writeErrors"]:
+                        operation, ids = written[write_error["index"]]
+                        detail = "User already exists in the organization" if write_error["code"] == 11000 else write_error["errmsg"]
+                        failed.update({(operation, user_id): detail for user_id in ids})
+                    for item in results:
+                        if (item["operation"], item["user_id"]) in failed:
+                            item.update(success=False, detail=failed[(item["operation"], item["user_id"])])
+                    added_user_ids = [user_id for user_id in added_user_ids if ("add", user_id) not in failed]
+                    user_ids_to_remove = [user_id for user_id in user_ids_to_remove if ("remove", user_id) not in failed]
+            
+            # Only the users that are no longer members lose the organization
+            if user_ids_to_remove and removed_count < len(user_ids_to_remove):
+                remaining = db[MEMBERSHIPS_COLLECTION].find({"org_id": organization_id, "user_id": {"$in": user_ids_to_remove}}, {"user_id": 1}, session=session)
+                remaining_user_ids = {membership["user_id"] async for membership in remaining}
+                user_ids_to_remove = [user_id for user_id in user_ids_to_remove if user_id not in remaining_user_ids]
+            
+            # Mirror the changes in the users' organizations lists
+            user_writes = []
+            if added_user_ids:
+                user_writes.append(UpdateMany(
+                    {"_id": {"$in": added_user_ids}},
+                    bump_version({"$addToSet": {"organizations": organization_id}})
+                ))
+            if user_ids_to_remove:
+                user_writes.append(UpdateMany(
+                    {"_id": {"$in": user_ids_to_remove}, "organizations": organization_id},
+                    bump_version({"$pull": {"organizations": organization_id}})
+                ))
+            if user_writes:
+                await db.users.bulk_write(user_writes, ordered=False, session=session)
+            
+            if added_user_ids or removed_count or updates_by_access_level:
+                organization = await update_organization_members(
+                    db, organization, {"$inc": {"member_count": len(added_user_ids) - removed_count}}, claimed,
+                    added_user_ids + [user_id for ids in updates_by_access_level.values() for user_id in ids],
+                    session=session, projection={VERSION_FIELD: 1}
+                )
+            elif claimed:
+                organization = {**organization, VERSION_FIELD: organization.get(VERSION_FIELD, 0) + 1}
+            
+            return organization, results, added_user_ids + user_ids_to_remove
+        
+        organization, results, changed_user_ids = await run_in_transaction(db, writes)
+        user_cache.invalidate(*changed_user_ids)
+        organization_cache.invalidate(organization_id)
         
-        # Remove the organization from the user's organizations list
-        await db.users.find_one_and_update(
-            {"_id": ObjectId(user_id)},
-            {"$pull": {"organizations": ObjectId(organization_id)}}
+        response.headers["ETag"] = etag(organization)
+        set_causal_token(response, db)
+        return {"organization_id": organization_id, "results": results}
+    
+    except ConnectionFailure:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update organization members."
         )
+
+"""
+    Delete method for deleting an organization, by one of its ADMINs.
+    
+    The organization is removed from the organizations list of all its members with a single
+    update_many, inside a transaction when the server supports them. Organizations with more than
+    delete_inline_max_members members are deleted right away but their members are cleaned up in
+    chunks in the background, and the request is answered with 202.
+    
+    Raises:
+        HTTPException: Fields validation error
+        HTTPException: Organization not found error
+        HTTPException: Author is not an ADMIN error
+        HTTPException: Internal server error
+    
+    Returns:
+        _type_: organization_id, status, member_count
+"""
+@router.delete("/{organization_id}/{author_id}", response_description="Delete an organization", status_code=status.HTTP_200_OK, response_model=OrganizationDeletionResponse)
+async def delete_organization(organization_id: str, author_id: str, response: Response, db: AsyncIOMotorDatabase = Depends(get_database)):
+    validate_string_fields(organization_id, author_id, detail="All the fields are required")
+    
+    try:
+        organization_id, author_id = ObjectId(organization_id), ObjectId(author_id)
+        
+        # Check if the organization exists and the author is a ADMIN of it
+        organization = await get_organization_as_admin(db, organization_id, author_id)
         
-        return await db.organizations.find_one({"_id": ObjectId(organization_id)})
+        member_count = organization.get("member_count", 0)
+        if member_count <= settings.delete_inline_max_members:
+            deleted = await delete_organization_with_members(db, organization_id)
+            deletion_status = "deleted"
+        else:
+            deleted = await start_organization_deletion(db, organization_id)
+            if deleted:
+                schedule_organization_cleanup(db, organization_id)
+            response.status_code = status.HTTP_202_ACCEPTED
+            deletion_status = "deleting"
+        
+        # Deleted by a concurrent request
+        if not deleted:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
+        
+        # The members' cached documents are invalidated as they are cleaned up
+        organization_cache.invalidate(organization_id)
+        return {"organization_id": organization_id, "status": deletion_status, "member_count": member_count}
     
     except ConnectionFailure:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to remove user from organization."
-        )
\ No newline at end of file
+            detail="Failed to delete organization."
+        )
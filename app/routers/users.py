@@ -1,11 +1,32 @@
-from fastapi import APIRouter, HTTPException, status, Body
+import time
+
+from fastapi import APIRouter, HTTPException, status, Body, Query, Depends, Request, Response, Header
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from bson import ObjectId
-from pymongo.errors import DuplicateKeyError, ConnectionFailure
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError, ConnectionFailure, BulkWriteError
 
-from .. lib.validators import validate_string_fields, validate_db_connection
-from .. database import connect_to_db
-from .. models.users import UserBaseModel, UserModel
-from .. schemas.users import UserResponse, UsersResponse
+from .. lib.validators import validate_string_fields
+from .. lib.pagination import paginate
+from .. lib.search import name_query, text_search_page, with_normalized_name
+from .. lib.counters import get_total_count, increment_total
+from .. lib.export import export_response, user_record, USER_COLUMNS
+from .. lib.ndjson import iter_lines
+from .. lib.cache import user_cache
+from .. lib.singleflight import lookups
+from .. lib.lookups import bulk_lookup
+from .. lib.coalescing import user_inserts
+from .. lib.projections import parse_fields, build_projection, USER_FIELDS
+from .. lib.serializers import render, user_payload, users_payload, users_lookup_payload
+from .. lib.expansions import parse_expand, expand_organizations, USER_EXPANSIONS
+from .. lib.versions import VERSION_FIELD, with_version, etag, etag_matches
+from .. config import settings
+from .. lib.consistency import set_causal_token
+from .. database import get_database, get_read_database, get_write_database
+from .. models import SortField, TotalCount, ExportFormat, SearchMode
+from .. models.users import UserBaseModel, UserModel, UserLookupModel
+from .. schemas.users import UserResponse, UsersResponse, UsersLookupResponse, UserImportResponse
 
 router = APIRouter(
     tags=["Users"],
@@ -15,6 +36,9 @@ router = APIRouter(
 """
     Post method for creating a new user.
     
+    With insert_coalescing_enabled, concurrent creations are written together with a single
+    unordered insert_many, each request still getting the outcome of its own user.
+    
     Raises:
         HTTPException: Fields validation error
         HTTPException: Duplicate user error
@@ -24,16 +48,15 @@ router = APIRouter(
         _type_: User
 """
 @router.post("/", response_description="Create new user", status_code=status.HTTP_201_CREATED, response_model=UserResponse)
-async def create_user(user: UserBaseModel = Body(...)):
-    db = await connect_to_db()
-    validate_db_connection(db)
-    
+async def create_user(response: Response, user: UserBaseModel = Body(...), db: AsyncIOMotorDatabase = Depends(get_write_database)):
     validate_string_fields(user.name, user.email, detail="Both name and email fields are required")
     
     try:
-        user = UserModel(**user.dict())
-        result = await db.users.insert_one(user.dict())
-        return await db.users.find_one({ "_id": result.inserted_id })
+        # The response is built from the inserted document, which gets its _id from the insert
+        user = with_version(with_normalized_name(UserModel(**user.dict()).dict()))
+        await user_inserts.insert(db.users, user)
+        set_causal_token(response, db)
+        return render(user, user_payload, status.HTTP_201_CREATED, response=response)
     
     except DuplicateKeyError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
@@ -45,42 +68,194 @@ async def create_user(user: UserBaseModel = Body(...)):
         )
 
 """
-    Get method for retrieving a list of users(filtered by name, and paginated i.e limit and offset)
+    Post method for importing users from an NDJSON request body, one UserBaseModel per line.
+    
+    The body is streamed and validated line by line, valid rows are written with unordered
+    insert_many in batches of import_batch_size, so memory stays bounded whatever the upload size.
+    Rows that fail validation or hit the unique email index are reported with their line number
+    instead of aborting the import.
+    
+    Raises:
+        HTTPException: Internal server error
+    
+    Returns:
+        _type_: received, inserted, failed
+        _type_: List[UserImportError]
+        _type_: duration_seconds, rows_per_second
+"""
+@router.post("/import", response_description="Import users from NDJSON", status_code=status.HTTP_200_OK, response_model=UserImportResponse)
+async def import_users(request: Request, db: AsyncIOMotorDatabase = Depends(get_database)):
+    started = time.monotonic()
+    report = {"received": 0, "inserted": 0, "failed": 0, "errors": [], "errors_truncated": False}
+    
+    def add_error(line_number: int, detail: str):
+        report["failed"] += 1
+        if len(report["errors"]) < settings.import_max_reported_errors:
+            report["errors"].append({"line": line_number, "detail": detail})
+        else:
+            report["errors_truncated"] = True
+    
+    async def flush(documents: list, line_numbers: list):
+        inserted = len(documents)
+        try:
+            await db.users.insert_many(documents, ordered=False)
+        except BulkWriteError as error:
+            inserted = error.details["nInserted"]
+            for write_error in error.details["writeErrors"]:
+                detail = "User already exists" if write_error["code"] == 11000 else write_error["errmsg"]
+                add_error(line_numbers[write_error["index"]], detail)
+        
+        report["inserted"] += inserted
+        await increment_total(db, "users", inserted)
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        print(f"User import: {report['received']} rows received, {report['inserted']} inserted, {report['failed']} failed ({report['received'] / elapsed:.0f} rows/s)")
+
+    try:
+        documents, line_numbers = [], []
+        async for line_number, line in iter_lines(request.stream(), settings.import_max_line_bytes):
+            report["received"] += 1
+            if line is None:
+                add_error(line_number, f"Line is longer than {settings.import_max_line_bytes} bytes")
+                continue
+            
+            try:
+                user = UserBaseModel.parse_raw(line)
+            except ValidationError as error:
+                add_error(line_number, str(error).replace("\n", " "))
+                continue
+            
+            if not user.name.strip():
+                add_error(line_number, "Both name and email fields are required")
+                continue
+            
+            documents.append(with_version(with_normalized_name(UserModel(**user.dict()).dict())))
+            line_numbers.append(line_number)
+            if len(documents) >= settings.import_batch_size:
+                await flush(documents, line_numbers)
+                documents, line_numbers = [], []
+        
+        if documents:
+            await flush(documents, line_numbers)
+    
+    except ConnectionFailure:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to import users."
+        )
+    
+    duration = time.monotonic() - started
+    report["duration_seconds"] = round(duration, 3)
+    report["rows_per_second"] = round(report["received"] / duration, 1) if duration > 0 else 0.0
+    return report
+
+"""
+    Post method for resolving many users at once, by a mixed list of IDs and emails.
+    
+    The keys are split into at most two $in queries, one by _id and one by email, and read through
+    the cache when it is enabled. Results are keyed by the requested key, and keys that match no
+    user are listed in missing.
+    
+    Raises:
+        HTTPException: Empty or too large batch error
+        HTTPException: Internal server error
+    
+    Returns:
+        _type_: Dict[key, User]
+        _type_: missing
+"""
+@router.post("/lookup", response_description="Resolve many users by ID or email", status_code=status.HTTP_200_OK, response_model=UsersLookupResponse)
+async def lookup_users(lookup: UserLookupModel = Body(...), db: AsyncIOMotorDatabase = Depends(get_read_database)):
+    if len(lookup.keys) == 0 or len(lookup.keys) > settings.max_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A lookup must contain between 1 and {settings.max_batch_size} keys"
+        )
+    
+    try:
+        return render(await bulk_lookup(db.users, user_cache, "email", lookup.keys), users_lookup_payload)
+    
+    except ConnectionFailure:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to look up users."
+        )
+
+"""
+    Get method for retrieving a list of users(filtered by name, and paginated).
+    
+    Pages are addressed with the opaque after/before cursors returned as next_cursor/prev_cursor,
+    sorted by id or by (name, id). Offset pagination is still available but capped.
+    expand=organizations replaces the organization ids of the users with the organizations,
+    resolved for the whole page with a single query.
     
     Raises:
+        HTTPException: Invalid pagination parameters error
+        HTTPException: Unknown field or relation error
         HTTPException: No users found error
         HTTPException: Internal server error
     
     Returns:
         _type_: total_count
         _type_: List[User]
+        _type_: next_cursor, prev_cursor
 """
 @router.get("/", response_description="List all users", status_code=status.HTTP_200_OK, response_model=UsersResponse)
-async def get_users(name: str = None, limit: int = 10, offset: int = 0):
-    db = await connect_to_db()
-    validate_db_connection(db)
-
+async def get_users(
+    name: str = None,
+    limit: int = Query(10, ge=1, le=settings.max_page_limit),
+    offset: int = Query(0, ge=0, le=settings.max_page_offset),
+    after: str = None,
+    before: str = None,
+    sort_by: SortField = SortField.ID,
+    search: SearchMode = SearchMode.CONTAINS,
+    include_total: bool = True,
+    count_mode: TotalCount = TotalCount.CACHED,
+    fields: str = None,
+    organizations_limit: int = Query(None, ge=0),
+    expand: str = None,
+    db: AsyncIOMotorDatabase = Depends(get_read_database)
+):
     # Query parameters
     query = {}
     if name:
-        query = {"name": {"$regex": name, "$options": "i"}}
+        query = name_query(name, search)
+    
+    # Sparse fieldset, the name is also read when the cursor is built from it
+    selected_fields = parse_fields(fields, USER_FIELDS)
+    expansions = parse_expand(expand, USER_EXPANSIONS)
+    if expansions and selected_fields is not None and "organizations" not in selected_fields:
+        selected_fields.append("organizations")
+    projection = build_projection(selected_fields, "organizations", organizations_limit, ["name"] if sort_by == SortField.NAME else [])
 
     try:
         # Pagination
-        total_count = await db.users.count_documents(query)
-        result = await db.users\
-                        .find(query)\
-                        .skip(offset)\
-                        .limit(limit)\
-                        .to_list(length=limit)
+        total_count = None
+        if include_total:
+            total_count = await get_total_count(db, "users", query, count_mode)
+        if name and search == SearchMode.TEXT:
+            if after or before:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Text search is paginated by offset only")
+            page = await text_search_page(db.users, query, limit, offset=offset, projection=projection)
+        else:
+            page = await paginate(db.users, query, sort_by, limit, offset=offset, after=after, before=before, projection=projection)
+        result = page["documents"]
                         
         if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No users found"
             )
+        
+        if expansions:
+            result = await expand_organizations(db, result)
                         
-        return {"total_count": total_count, "users": result}
+        return render({
+            "total_count": total_count,
+            "users": result,
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"]
+        }, users_payload, fields=selected_fields, expanded=bool(expansions))
     
     except ConnectionFailure:
         raise HTTPException(
@@ -88,34 +263,82 @@ async def get_users(name: str = None, limit: int = 10, offset: int = 0):
             detail="Failed to get users"
         )
         
+"""
+    Get method for exporting all the users, or the ones filtered by name, as NDJSON or CSV.
+    
+    The response is streamed from a single server-side cursor read in batches of batch_size,
+    so memory stays constant whatever the size of the export.
+    
+    Returns:
+        _type_: StreamingResponse
+"""
+@router.get("/export", response_description="Export users", status_code=status.HTTP_200_OK, response_class=StreamingResponse)
+async def export_users(
+    name: str = None,
+    search: SearchMode = SearchMode.CONTAINS,
+    format: ExportFormat = ExportFormat.NDJSON,
+    batch_size: int = Query(settings.export_batch_size, ge=1, le=settings.export_max_batch_size),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    # Query parameters
+    query = {}
+    if name:
+        query = name_query(name, search)
+    
+    cursor = db.users.find(query, batch_size=batch_size).sort("_id", 1)
+    return export_response(cursor, user_record, USER_COLUMNS, format, "users")
+        
 """
     Get method for retrieving an user, filtered by user_id or email.
+    expand=organizations replaces the organization ids of the user with the organizations.
+    
+    The response carries an ETag of the user's version. A matching If-None-Match is answered with
+    304 from a lookup of the version alone, without reading the whole document.
     
     Raises:
+        HTTPException: Unknown field or relation error
         HTTPException: User not found error
         HTTPException: Internal server error
     
     Returns:
-        _type_: User
+        _type_: User, or 304 Not Modified
 """     
 @router.get("/{user_id_or_email}", response_description="Get a single user", status_code=status.HTTP_200_OK, response_model=UserResponse)
-async def get_user(user_id_or_email: str):
-    db = await connect_to_db()
-    validate_db_connection(db)
-    
+async def get_user(user_id_or_email: str, response: Response, fields: str = None, organizations_limit: int = Query(None, ge=0), expand: str = None, if_none_match: str = Header(None), db: AsyncIOMotorDatabase = Depends(get_database)):
     if(ObjectId.is_valid(user_id_or_email)):
         query = {"_id": ObjectId(user_id_or_email)}
     else:
         query = {"email": user_id_or_email}
     
     try:
-        result = await db.users.find_one(query)
+        # Whole documents go through the cache, projections straight to Mongo
+        selected_fields = parse_fields(fields, USER_FIELDS)
+        expansions = parse_expand(expand, USER_EXPANSIONS)
+        if expansions and selected_fields is not None and "organizations" not in selected_fields:
+            selected_fields.append("organizations")
+        projection = build_projection(selected_fields, "organizations", organizations_limit, [VERSION_FIELD])
+        field, value = next(iter(query.items()))
+        
+        # Expanded organizations are not covered by the version of the user
+        if if_none_match and not expansions:
+            current = user_cache.get(field, value) or await db.users.find_one(query, {VERSION_FIELD: 1})
+            if current is not None and etag_matches(if_none_match, etag(current)):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag(current)})
+        
+        if projection is None:
+            result = await user_cache.get_or_load(field, value, lambda: lookups.do(("users", field, value), lambda: db.users.find_one(query)))
+        else:
+            result = await db.users.find_one(query, projection)
         if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
-        return result
+        if expansions:
+            result = (await expand_organizations(db, [result]))[0]
+        else:
+            response.headers["ETag"] = etag(result)
+        return render(result, user_payload, fields=selected_fields, expanded=bool(expansions), response=response)
     
     except ConnectionFailure:
         raise HTTPException(
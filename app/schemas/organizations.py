@@ -1,8 +1,8 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List, Optional
 from bson import ObjectId
 
-from .. models import PyObjectId
+from .. models import PyObjectId, AccessLevel
 from .. models.organizations import OrganizationModel
 
 """
@@ -16,15 +16,99 @@ class OrganizationResponse(OrganizationModel):
         json_encoders = {ObjectId: str}
         orm_mode = True
     
+"""
+Response schema for a member of an organization
+"""
+class MemberResponse(BaseModel):
+    user_id : PyObjectId
+    access_level : AccessLevel
+    
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+        orm_mode = True
+
+"""
+Response schema for a page of members of an organization
+"""
+class MembersResponse(BaseModel):
+    members : List[MemberResponse]
+    next_cursor : Optional[str] = None
+    
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+        orm_mode = True
+
 """
 Response schema for a list of organizations
 """
 class OrganizationsResponse(BaseModel):
-    total_count : int
+    total_count : Optional[int] = None
     organizations : List[OrganizationResponse]
+    next_cursor : Optional[str] = None
+    prev_cursor : Optional[str] = None
+    
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+        orm_mode = True
+
+"""
+Response schema for a bulk lookup of organizations, keyed by the requested ID or name
+"""
+class OrganizationsLookupResponse(BaseModel):
+    results : Dict[str, OrganizationResponse]
+    missing : List[str]
     
     class Config:
         allow_population_by_field_name = True
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+"""
+Response schema for the deletion of an organization, whose members are either already cleaned up
+(deleted) or being cleaned up in the background (deleting)
+"""
+class OrganizationDeletionResponse(BaseModel):
+    organization_id : PyObjectId
+    status : str
+    member_count : int
+    
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+        orm_mode = True
+
+"""
+Response schema for the result of a single operation of a member batch
+"""
+class MemberOperationResult(BaseModel):
+    operation : str
+    user_id : PyObjectId
+    success : bool
+    detail : Optional[str] = None
+    
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+        orm_mode = True
+
+"""
+Response schema for a member batch, with one result per operation
+"""
+class BatchMembersResponse(BaseModel):
+    organization_id : PyObjectId
+    results : List[MemberOperationResult]
+    
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+        orm_mode = True
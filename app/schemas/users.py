@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List, Optional
 from bson import ObjectId
 
 from .. models import PyObjectId
@@ -20,11 +20,45 @@ class UserResponse(UserModel):
 Response schema for a list of users
 """ 
 class UsersResponse(BaseModel):
-    total_count : int
+    total_count : Optional[int] = None
     users : List[UserResponse]
+    next_cursor : Optional[str] = None
+    prev_cursor : Optional[str] = None
     
     class Config:
         allow_population_by_field_name = True
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+"""
+Response schema for a bulk lookup of users, keyed by the requested ID or email
+"""
+class UsersLookupResponse(BaseModel):
+    results : Dict[str, UserResponse]
+    missing : List[str]
+    
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+        orm_mode = True
+
+"""
+Response schema for a row of a user import that could not be inserted
+"""
+class UserImportError(BaseModel):
+    line : int
+    detail : str
+
+"""
+Response schema for a user import
+"""
+class UserImportResponse(BaseModel):
+    received : int
+    inserted : int
+    failed : int
+    errors : List[UserImportError]
+    errors_truncated : bool
+    duration_seconds : float
+    rows_per_second : float
@@ -0,0 +1,97 @@
+"""
+Benchmark of the database work of a worker boot, before and after the migrations moved out of the startup.
+
+It migrates a separate database seeded with users and organizations, then compares the median time
+of the former startup path, every index creation and backfill run again against the migrated
+database, with the current readiness check of the migration version, along with the number of
+commands each boot sends. Both are also timed for a number of workers booting at once, as when the
+API is scaled out.
+
+    python -m benchmarks.boot_time --uri mongodb://localhost:27017 --documents 100000 --workers 40
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from app.lib.migrations import MIGRATIONS, apply_migrations, check_migrations
+from app.lib.search import normalize_name
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+async def seed(database, documents: int, batch_size: int = 10000):
+    await database.client.drop_database(database.name)
+    for start in range(0, documents, batch_size):
+        users = [
+            {"_id": ObjectId(), "name": f"User {i}", "name_lower": normalize_name(f"User {i}"), "email": f"user{i}@example.com", "organizations": []}
+            for i in range(start, min(start + batch_size, documents))
+        ]
+        await database.users.insert_many(users, ordered=False)
+        await database.organizations.insert_many([
+            {"name": f"Organization {i}", "name_lower": normalize_name(f"Organization {i}"), "created_by": user["_id"], "member_count": 1}
+            for i, user in enumerate(users, start)
+        ], ordered=False)
+    await apply_migrations(database, log=lambda message: None)
+
+async def legacy_boot(database):
+    for migration in MIGRATIONS:
+        await migration.apply(database, 1000)
+
+async def commands(boot, database, counter: CommandCounter) -> int:
+    counted = counter.count
+    await boot(database)
+    return counter.count - counted
+
+async def median_ms(boot, database, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await boot(database)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+async def concurrent_ms(boot, database, workers: int) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*[boot(database) for _ in range(workers)])
+    return (time.perf_counter() - started) * 1000
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="cosmocloud_boot_benchmark")
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(args.uri, maxPoolSize=args.workers * 2, event_listeners=[counter])
+    try:
+        database = client[args.database]
+        await seed(database, args.documents)
+
+        print(f"{args.documents} users and organizations, {args.workers} workers")
+        print(f"{'boot':<20} {'commands':>10} {'median ms':>12} {'workers at once ms':>20}")
+        for name, boot in (("create_index", legacy_boot), ("migration check", check_migrations)):
+            print(f"{name:<20} {await commands(boot, database, counter):>10} {await median_ms(boot, database, args.runs):>12.2f} {await concurrent_ms(boot, database, args.workers):>20.2f}")
+    finally:
+        await client.drop_database(args.database)
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
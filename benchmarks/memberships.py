@@ -0,0 +1,96 @@
+"""
+Benchmark of organization membership stored as an embedded members array against the memberships collection.
+
+For organizations of a growing size it seeds both layouts in a separate database, then compares the
+median latency of adding a member, checking that a user is an ADMIN and removing a member, the
+three operations behind the member endpoints.
+
+    python -m benchmarks.memberships --uri mongodb://localhost:27017 --sizes 100,1000,10000,100000
+"""
+import argparse
+import statistics
+import time
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+def median_ms(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def seed(database, size: int, batch_size: int = 10000):
+    database.organizations.drop()
+    database.memberships.drop()
+
+    organization_id, admin_id = ObjectId(), ObjectId()
+    members = [{"user_id": admin_id, "access_level": "ADMIN"}] + [{"user_id": ObjectId(), "access_level": "READ"} for _ in range(size - 1)]
+    database.organizations.insert_one({"_id": organization_id, "members": members})
+
+    database.memberships.create_index([("org_id", 1), ("user_id", 1)], unique=True)
+    database.memberships.create_index([("user_id", 1), ("org_id", 1)], unique=True)
+    for start in range(0, size, batch_size):
+        database.memberships.insert_many([dict(member, org_id=organization_id) for member in members[start:start + batch_size]], ordered=False)
+
+    return organization_id, admin_id
+
+def measure_embedded(database, organization_id: ObjectId, admin_id: ObjectId, runs: int) -> dict:
+    user_id = ObjectId()
+    return {
+        "add": median_ms(lambda: (
+            database.organizations.update_one(
+                {"_id": organization_id, "members.user_id": {"$ne": user_id}},
+                {"$push": {"members": {"user_id": user_id, "access_level": "READ"}}}
+            ),
+            database.organizations.update_one({"_id": organization_id}, {"$pull": {"members": {"user_id": user_id}}})
+        ), runs),
+        "check": median_ms(lambda: database.organizations.find_one(
+            {"_id": organization_id, "members": {"$elemMatch": {"user_id": admin_id, "access_level": "ADMIN"}}},
+            {"_id": 1}
+        ), runs),
+        "remove": median_ms(lambda: (
+            database.organizations.update_one({"_id": organization_id}, {"$pull": {"members": {"user_id": user_id}}}),
+            database.organizations.update_one({"_id": organization_id}, {"$push": {"members": {"user_id": user_id, "access_level": "READ"}}})
+        ), runs)
+    }
+
+def measure_collection(database, organization_id: ObjectId, admin_id: ObjectId, runs: int) -> dict:
+    user_id = ObjectId()
+    membership = {"org_id": organization_id, "user_id": user_id}
+    return {
+        "add": median_ms(lambda: (
+            database.memberships.insert_one(dict(membership, access_level="READ")),
+            database.memberships.delete_one(membership)
+        ), runs),
+        "check": median_ms(lambda: database.memberships.find_one(
+            {"user_id": admin_id, "org_id": organization_id, "access_level": "ADMIN"},
+            {"_id": 1}
+        ), runs),
+        "remove": median_ms(lambda: (
+            database.memberships.delete_one(membership),
+            database.memberships.insert_one(dict(membership, access_level="READ"))
+        ), runs)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="cosmocloud_benchmark")
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="Comma separated organization sizes")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    database = MongoClient(args.uri)[args.database]
+    print("Add and remove timings include the write that restores the previous state.")
+    print(f"{'members':>8}  {'layout':<11}{'add ms':>10}{'check ms':>10}{'remove ms':>11}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        organization_id, admin_id = seed(database, size)
+        for layout, measure in (("embedded", measure_embedded), ("collection", measure_collection)):
+            result = measure(database, organization_id, admin_id, args.runs)
+            print(f"{size:>8}  {layout:<11}{result['add']:>10.2f}{result['check']:>10.2f}{result['remove']:>11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the name search modes of the list endpoints.
+
+Seeds a collection of random names in a separate database (1M documents by default), creates the
+same indexes as the API and compares the contains, prefix and text modes: median latency of the
+first page, and documents/keys examined according to explain("executionStats").
+
+    python -m benchmarks.search_modes --uri mongodb://localhost:27017 --documents 1000000
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+
+from pymongo import MongoClient
+
+from app.lib.search import NORMALIZED_NAME_FIELD, name_query, normalize_name
+from app.models import SearchMode
+
+WORDS = ["".join(random.choices(string.ascii_lowercase, k=random.randint(4, 9))) for _ in range(5000)]
+
+def random_name() -> str:
+    return " ".join(random.choice(WORDS).capitalize() for _ in range(2))
+
+def seed(collection, documents: int, batch_size: int = 10000):
+    collection.drop()
+    for start in range(0, documents, batch_size):
+        batch = []
+        for _ in range(min(batch_size, documents - start)):
+            name = random_name()
+            batch.append({"name": name, NORMALIZED_NAME_FIELD: normalize_name(name)})
+        collection.insert_many(batch, ordered=False)
+
+    collection.create_index(NORMALIZED_NAME_FIELD)
+    collection.create_index([("name", "text")])
+
+def measure(collection, term: str, mode: SearchMode, runs: int, limit: int) -> dict:
+    query = name_query(term, mode)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        if mode == SearchMode.TEXT:
+            cursor = collection.find(query, {"score": {"$meta": "textScore"}}).sort([("score", {"$meta": "textScore"})])
+        else:
+            cursor = collection.find(query)
+        list(cursor.limit(limit))
+        timings.append((time.perf_counter() - started) * 1000)
+
+    stats = collection.database.command({"explain": {"find": collection.name, "filter": query, "limit": limit}, "verbosity": "executionStats"})["executionStats"]
+    return {
+        "median_ms": statistics.median(timings),
+        "docs_examined": stats["totalDocsExamined"],
+        "keys_examined": stats["totalKeysExamined"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="cosmocloud_benchmark")
+    parser.add_argument("--documents", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the collection of a previous run")
+    args = parser.parse_args()
+
+    collection = MongoClient(args.uri)[args.database]["search_benchmark"]
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed(collection, args.documents)
+        print(f"Seeded {args.documents} documents in {time.perf_counter() - started:.1f}s")
+
+    term = random.choice(WORDS)
+    print(f"Search term: {term!r}")
+    print(f"{'mode':<10}{'median ms':>12}{'docs examined':>16}{'keys examined':>16}")
+    for mode in SearchMode:
+        result = measure(collection, term[:4] if mode == SearchMode.PREFIX else term, mode, args.runs, args.limit)
+        print(f"{mode.value:<10}{result['median_ms']:>12.2f}{result['docs_examined']:>16}{result['keys_examined']:>16}")
+
+if __name__ == "__main__":
+    main()
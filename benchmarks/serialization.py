@@ -0,0 +1,87 @@
+"""
+Benchmark of the fast serialization path against the response_model path.
+
+For a single organization, pages of organizations and pages of users, it first checks that both
+paths produce the same JSON byte for byte, then compares the time to serialize one payload.
+No database is needed, the documents are generated in memory.
+
+    DATABASE_HOSTNAME=mongodb://localhost DATABASE_PORT=27017 DATABASE_NAME=cosmocloud python -m benchmarks.serialization
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.lib.serializers import json_response, organization_payload, organizations_payload, users_payload
+from app.schemas.organizations import OrganizationResponse, OrganizationsResponse
+from app.schemas.users import UsersResponse
+
+def organization_document(member_count: int) -> dict:
+    return {
+        "_id": ObjectId(),
+        "name": "Organization é \"quoted\"",
+        "name_lower": "organization é \"quoted\"",
+        "created_by": ObjectId(),
+        "member_count": member_count
+    }
+
+def organizations_content(organizations: int) -> dict:
+    return {
+        "total_count": None,
+        "organizations": [organization_document(i + 1) for i in range(organizations)],
+        "next_cursor": None,
+        "prev_cursor": "WyI2NDQ2ZjQ1In0"
+    }
+
+def users_content(users: int) -> dict:
+    return {
+        "total_count": users * 10,
+        "users": [
+            {"_id": ObjectId(), "name": f"User {i}", "email": f"user{i}@example.com", "organizations": [ObjectId() for _ in range(3)]}
+            for i in range(users)
+        ],
+        "next_cursor": "WyI2NDQ2ZjQ1In0",
+        "prev_cursor": None
+    }
+
+async def response_model_body(field, content) -> bytes:
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+def timed(fn, runs: int) -> float:
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - started) / runs * 1000
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    cases = [("organization", OrganizationResponse, organization_document(1), organization_payload, 1)]
+    cases += [("orgs page", OrganizationsResponse, organizations_content(size), organizations_payload, size) for size in (10, 100)]
+    cases += [("users page", UsersResponse, users_content(size), users_payload, size) for size in (10, 100)]
+
+    print(f"{'payload':<14}{'size':>7}{'bytes':>10}{'response_model ms':>20}{'fast ms':>10}{'speedup':>9}")
+    for label, schema, content, build_payload, size in cases:
+        field = create_response_field(name="Response", type_=schema)
+        expected = await response_model_body(field, content)
+        actual = json_response(build_payload(content)).body
+        if expected != actual:
+            print(f"{label} ({size}): fast path output differs from the response_model output", file=sys.stderr)
+            sys.exit(1)
+
+        started = time.perf_counter()
+        for _ in range(args.runs):
+            await response_model_body(field, content)
+        slow = (time.perf_counter() - started) / args.runs * 1000
+        fast = timed(lambda: json_response(build_payload(content)).body, args.runs)
+        print(f"{label:<14}{size:>7}{len(actual):>10}{slow:>20.3f}{fast:>10.3f}{slow / fast:>8.1f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,6 @@
+import os
+
+# The settings require a database, the tests never connect to it
+os.environ.setdefault("DATABASE_HOSTNAME", "localhost")
+os.environ.setdefault("DATABASE_PORT", "27017")
+os.environ.setdefault("DATABASE_NAME", "cosmocloud_test")
@@ -0,0 +1,65 @@
+import asyncio
+
+from app.lib.admission import AdmissionLimiter, route_class
+
+async def settle():
+    # A woken waiter resumes through wait_for and shield, which takes a few loop iterations
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+def test_route_class():
+    assert route_class("GET", "/users/") == "list"
+    assert route_class("GET", "/users/{user_id_or_email}") == "read"
+    assert route_class("POST", "/users/lookup") == "read"
+    assert route_class("POST", "/users/") == "write"
+    assert route_class("GET", "/health") is None
+
+def test_admits_up_to_the_limit_then_queues_in_order():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrency=1, max_queue=2, queue_timeout=1)
+        assert await limiter.acquire() is None
+        admitted = []
+
+        async def waiter(name):
+            assert await limiter.acquire() is None
+            admitted.append(name)
+
+        waiters = [asyncio.ensure_future(waiter(name)) for name in ("first", "second")]
+        await asyncio.sleep(0)
+        assert limiter.queued == 2
+        assert await limiter.acquire() == "queue_full"
+
+        limiter.release()
+        await settle()
+        assert admitted == ["first"]
+        limiter.release()
+        await asyncio.gather(*waiters)
+        assert admitted == ["first", "second"]
+        assert limiter.active == 1 and limiter.queued == 0
+
+        limiter.release()
+        assert limiter.active == 0
+    asyncio.run(scenario())
+
+def test_wait_times_out():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrency=1, max_queue=1, queue_timeout=0.01)
+        assert await limiter.acquire() is None
+        assert await limiter.acquire() == "queue_timeout"
+        assert limiter.queued == 0
+        limiter.release()
+        assert limiter.active == 0
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_does_not_leak_its_slot():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_concurrency=1, max_queue=1, queue_timeout=1)
+        assert await limiter.acquire() is None
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        assert limiter.active == 0 and limiter.queued == 0
+    asyncio.run(scenario())
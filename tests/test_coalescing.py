@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError
+
+from app.lib.coalescing import InsertCoalescer
+from app.lib.counters import COUNTERS_COLLECTION
+
+class FakeCounters:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.increments = []
+
+    async def update_one(self, filter, update, **kwargs):
+        if self.fail:
+            raise AutoReconnect("counter unavailable")
+        self.increments.append((filter["_id"], update["$inc"]["count"]))
+
+class FakeDatabase:
+    def __init__(self, counters: FakeCounters):
+        self.counters = counters
+
+    def __getitem__(self, name):
+        assert name == COUNTERS_COLLECTION
+        return self.counters
+
+class FakeCollection:
+    name = "users"
+    full_name = "test.users"
+
+    def __init__(self, counters: FakeCounters = None, duplicates=(), failure: Exception = None):
+        self.database = FakeDatabase(counters or FakeCounters())
+        self.duplicates = set(duplicates)
+        self.failure = failure
+        self.batches = []
+
+    async def insert_one(self, document):
+        await self.insert_many([document])
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        self.batches.append([document["email"] for document in documents])
+        if self.failure is not None:
+            raise self.failure
+        errors = [
+            {"index": index, "code": 11000, "errmsg": "duplicate key"}
+            for index, document in enumerate(documents) if document["email"] in self.duplicates
+        ]
+        if errors:
+            raise BulkWriteError({"nInserted": len(documents) - len(errors), "writeErrors": errors})
+
+def insert_all(coalescer: InsertCoalescer, collection: FakeCollection, emails) -> list:
+    async def scenario():
+        return await asyncio.gather(*[coalescer.insert(collection, {"email": email}) for email in emails], return_exceptions=True)
+    return asyncio.run(scenario())
+
+def test_concurrent_inserts_share_one_batch():
+    collection = FakeCollection()
+    coalescer = InsertCoalescer("users", window_ms=5, max_docs=100)
+    assert insert_all(coalescer, collection, ["a", "b", "c"]) == [None, None, None]
+    assert collection.batches == [["a", "b", "c"]]
+    assert collection.database.counters.increments == [("users", 3)]
+
+def test_full_batch_is_written_at_once():
+    collection = FakeCollection()
+    coalescer = InsertCoalescer("users", window_ms=1000, max_docs=2)
+    insert_all(coalescer, collection, ["a", "b", "c", "d"])
+    assert collection.batches == [["a", "b"], ["c", "d"]]
+
+def test_each_caller_gets_its_own_write_error():
+    collection = FakeCollection(duplicates={"b"})
+    results = insert_all(InsertCoalescer("users", window_ms=5, max_docs=100), collection, ["a", "b", "c"])
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], DuplicateKeyError)
+    assert collection.database.counters.increments == [("users", 2)]
+
+def test_batch_failure_fails_every_caller():
+    collection = FakeCollection(failure=AutoReconnect("primary stepped down"))
+    results = insert_all(InsertCoalescer("users", window_ms=5, max_docs=100), collection, ["a", "b"])
+    assert all(isinstance(result, AutoReconnect) for result in results)
+    assert collection.database.counters.increments == []
+
+@pytest.mark.parametrize("enabled", [True, False])
+def test_counter_failure_does_not_fail_the_inserts(enabled):
+    collection = FakeCollection(counters=FakeCounters(fail=True))
+    coalescer = InsertCoalescer("users", window_ms=5, max_docs=100, enabled=enabled)
+    assert insert_all(coalescer, collection, ["a", "b"]) == [None, None]
+    assert coalescer.stats()["counter_failures"] == (1 if enabled else 2)
+
+def test_disabled_coalescer_inserts_one_by_one():
+    collection = FakeCollection()
+    insert_all(InsertCoalescer("users", window_ms=5, max_docs=100, enabled=False), collection, ["a", "b"])
+    assert collection.batches == [["a"], ["b"]]
+    assert collection.database.counters.increments == [("users", 1), ("users", 1)]
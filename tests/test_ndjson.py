@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from app.lib.ndjson import iter_lines
+
+async def chunks_of(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+def lines(data: bytes, size: int, max_line_bytes: int = 100) -> list:
+    async def collect():
+        return [line async for line in iter_lines(chunks_of(data, size), max_line_bytes)]
+    return asyncio.run(collect())
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_lines_across_chunks(size):
+    data = b'{"a": 1}\n\n  {"b": 2}  \r\n{"c": 3}'
+    assert lines(data, size) == [(1, b'{"a": 1}'), (3, b'{"b": 2}'), (4, b'{"c": 3}')]
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_long_lines_are_reported(size):
+    data = b"short\n" + b"x" * 50 + b"\nafter\n" + b"y" * 50
+    assert lines(data, size, max_line_bytes=10) == [(1, b"short"), (2, None), (3, b"after"), (4, None)]
+
+def test_trailing_newline_and_empty_input():
+    assert lines(b"a\nb\n", 1) == [(1, b"a"), (2, b"b")]
+    assert lines(b"", 1) == []
+    assert lines(b"\n\n", 1) == []
@@ -0,0 +1,41 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.lib.pagination import decode_cursor, encode_cursor, keyset_query, sort_spec
+from app.models import SortField
+
+DOCUMENT = {"_id": ObjectId("6446f45b9c9d1b1b8c8c8c8c"), "name": "Zoë, \"the\" = name"}
+
+@pytest.mark.parametrize("sort_by", [SortField.ID, SortField.NAME])
+def test_cursor_round_trip(sort_by):
+    cursor = encode_cursor(DOCUMENT, sort_by)
+    expected = [DOCUMENT["_id"]] if sort_by == SortField.ID else [DOCUMENT["name"], DOCUMENT["_id"]]
+    assert decode_cursor(cursor, sort_by) == expected
+
+def test_cursor_is_url_safe_and_unpadded():
+    cursor = encode_cursor(DOCUMENT, SortField.NAME)
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "bm90IGpzb24", "e30", "WyJub3QgYW4gaWQiXQ"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, SortField.ID)
+    assert error.value.status_code == 400
+
+def test_cursor_of_another_sort_field_is_rejected():
+    with pytest.raises(HTTPException):
+        decode_cursor(encode_cursor(DOCUMENT, SortField.ID), SortField.NAME)
+    with pytest.raises(HTTPException):
+        decode_cursor(encode_cursor(DOCUMENT, SortField.NAME), SortField.ID)
+
+def test_sort_spec_breaks_ties_on_id():
+    assert sort_spec(SortField.NAME) == [("name", 1), ("_id", 1)]
+    assert sort_spec(SortField.ID, forward=False) == [("_id", -1)]
+
+def test_keyset_query():
+    _id = DOCUMENT["_id"]
+    assert keyset_query({}, SortField.ID, [_id]) == {"_id": {"$gt": _id}}
+    assert keyset_query({"name_lower": "a"}, SortField.NAME, ["a", _id], forward=False) == {
+        "$and": [{"name_lower": "a"}, {"$or": [{"name": {"$lt": "a"}}, {"name": "a", "_id": {"$lt": _id}}]}]
+    }
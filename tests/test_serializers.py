@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.lib.projections import ORGANIZATION_FIELDS, USER_FIELDS
+from app.lib.serializers import (
+    json_response, members_payload, organization_payload, organizations_lookup_payload, organizations_payload,
+    user_payload, users_lookup_payload, users_payload
+)
+from app.schemas.organizations import MembersResponse, OrganizationResponse, OrganizationsLookupResponse, OrganizationsResponse
+from app.schemas.users import UserResponse, UsersLookupResponse, UsersResponse
+
+def user_document(i: int, organizations: int = 2) -> dict:
+    document = {
+        "_id": ObjectId(f"{i:024x}"),
+        "name": f"User é \"{i}\"",
+        "name_lower": f"user é \"{i}\"",
+        "email": f"user{i}@example.com",
+        "version": 3
+    }
+    if organizations:
+        document["organizations"] = [ObjectId(f"{1000 + i * 10 + j:024x}") for j in range(organizations)]
+    return document
+
+def organization_document(i: int, member_count: int = None) -> dict:
+    document = {
+        "_id": ObjectId(f"{5000 + i:024x}"),
+        "name": f"Organization \\ {i}",
+        "name_lower": f"organization \\ {i}",
+        "created_by": ObjectId(f"{i:024x}"),
+        "version": 1
+    }
+    if member_count is not None:
+        document["member_count"] = member_count
+    return document
+
+USERS = [user_document(1), user_document(2, organizations=0), user_document(3, organizations=5)]
+ORGANIZATIONS = [organization_document(1, 4), organization_document(2), organization_document(3, 0)]
+
+def response_model_body(schema, content) -> bytes:
+    field = create_response_field(name="Response", type_=schema)
+    return JSONResponse(asyncio.run(serialize_response(field=field, response_content=content))).body
+
+def sparse_body(schema, content, fields) -> bytes:
+    # The response_model output restricted to the selected fields and the id, in the same order
+    field = create_response_field(name="Response", type_=schema)
+    payload = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse({key: value for key, value in payload.items() if key in fields or key == "_id"}).body
+
+@pytest.mark.parametrize("document", USERS)
+def test_user_payload_matches_response_model(document):
+    assert json_response(user_payload(document)).body == response_model_body(UserResponse, document)
+
+@pytest.mark.parametrize("document", ORGANIZATIONS)
+def test_organization_payload_matches_response_model(document):
+    assert json_response(organization_payload(document)).body == response_model_body(OrganizationResponse, document)
+
+@pytest.mark.parametrize("cursors", [(None, None), ("WyI2NDQ2ZjQ1Il0", None), (None, "WyJhIiwiNjQ0NmY0NSJd")])
+@pytest.mark.parametrize("total_count", [None, 0, 42])
+def test_users_payload_matches_response_model(cursors, total_count):
+    content = {"total_count": total_count, "users": USERS, "next_cursor": cursors[0], "prev_cursor": cursors[1]}
+    assert json_response(users_payload(content)).body == response_model_body(UsersResponse, content)
+
+@pytest.mark.parametrize("cursors", [(None, None), ("WyI2NDQ2ZjQ1Il0", "WyJhIiwiNjQ0NmY0NSJd")])
+@pytest.mark.parametrize("total_count", [None, 7])
+def test_organizations_payload_matches_response_model(cursors, total_count):
+    content = {"total_count": total_count, "organizations": ORGANIZATIONS, "next_cursor": cursors[0], "prev_cursor": cursors[1]}
+    assert json_response(organizations_payload(content)).body == response_model_body(OrganizationsResponse, content)
+
+def test_empty_pages_match_response_model():
+    users = {"users": [], "next_cursor": None, "prev_cursor": None}
+    organizations = {"organizations": [], "next_cursor": None, "prev_cursor": None}
+    assert json_response(users_payload(users)).body == response_model_body(UsersResponse, users)
+    assert json_response(organizations_payload(organizations)).body == response_model_body(OrganizationsResponse, organizations)
+
+def test_users_lookup_payload_matches_response_model():
+    content = {
+        "results": {str(USERS[0]["_id"]): USERS[0], USERS[1]["email"]: USERS[1], USERS[2]["email"]: USERS[2]},
+        "missing": ["missing@example.com", "0" * 24]
+    }
+    assert json_response(users_lookup_payload(content)).body == response_model_body(UsersLookupResponse, content)
+
+def test_organizations_lookup_payload_matches_response_model():
+    content = {
+        "results": {str(ORGANIZATIONS[0]["_id"]): ORGANIZATIONS[0], ORGANIZATIONS[1]["name"]: ORGANIZATIONS[1]},
+        "missing": []
+    }
+    assert json_response(organizations_lookup_payload(content)).body == response_model_body(OrganizationsLookupResponse, content)
+
+@pytest.mark.parametrize("next_cursor", [None, "WyI2NDQ2ZjQ1Il0"])
+def test_members_payload_matches_response_model(next_cursor):
+    content = {
+        "members": [
+            {"_id": ObjectId(), "org_id": ORGANIZATIONS[0]["_id"], "user_id": user["_id"], "access_level": access_level}
+            for user, access_level in zip(USERS, ("ADMIN", "WRITE", "READ"))
+        ],
+        "next_cursor": next_cursor
+    }
+    assert json_response(members_payload(content)).body == response_model_body(MembersResponse, content)
+
+@pytest.mark.parametrize("fields", [["name"], ["email", "organizations"], ["organizations"], list(USER_FIELDS)])
+def test_user_fields_match_response_model(fields):
+    for document in USERS:
+        assert json_response(user_payload(document, fields)).body == sparse_body(UserResponse, document, fields)
+
+@pytest.mark.parametrize("fields", [["name"], ["created_by", "member_count"], ["member_count"], list(ORGANIZATION_FIELDS)])
+def test_organization_fields_match_response_model(fields):
+    for document in ORGANIZATIONS:
+        assert json_response(organization_payload(document, fields)).body == sparse_body(OrganizationResponse, document, fields)
+
+def test_page_fields_keep_the_page_keys():
+    content = {"total_count": None, "users": USERS, "next_cursor": "WyI2NDQ2ZjQ1Il0", "prev_cursor": None}
+    payload = users_payload(content, ["email"])
+    assert list(payload) == ["total_count", "users", "next_cursor", "prev_cursor"]
+    assert [list(user) for user in payload["users"]] == [["email", "_id"]] * len(USERS)
+
+def test_expanded_members_are_kept():
+    members = [{"user_id": USERS[0]["_id"], "access_level": "ADMIN", "name": USERS[0]["name"], "email": USERS[0]["email"]}]
+    payload = organization_payload(dict(ORGANIZATIONS[0], members=members))
+    assert payload["members"] == members
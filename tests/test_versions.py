@@ -0,0 +1,33 @@
+from bson import ObjectId
+
+from app.lib.versions import VERSION_FIELD, bump_version, etag, etag_matches, version_filter, with_version
+
+_ID = ObjectId("6446f45b9c9d1b1b8c8c8c8c")
+
+def test_etag_of_documents_without_version():
+    assert etag({"_id": _ID}) == f'"{_ID}-0"'
+    assert etag({"_id": _ID, VERSION_FIELD: 4}) == f'"{_ID}-4"'
+
+def test_weak_comparison():
+    tag = etag({"_id": _ID, VERSION_FIELD: 2})
+    assert etag_matches(tag, tag)
+    assert etag_matches(f"W/{tag}", tag)
+    assert etag_matches(f'"other", W/{tag}', tag)
+    assert etag_matches("*", tag)
+    assert not etag_matches(etag({"_id": _ID, VERSION_FIELD: 1}), tag)
+
+def test_strong_comparison():
+    tag = etag({"_id": _ID, VERSION_FIELD: 2})
+    assert etag_matches(tag, tag, weak=False)
+    assert etag_matches(f'"other" , {tag}', tag, weak=False)
+    assert etag_matches("*", tag, weak=False)
+    assert not etag_matches(f"W/{tag}", tag, weak=False)
+
+def test_version_updates():
+    assert with_version({"name": "a"}) == {"name": "a", VERSION_FIELD: 1}
+    assert bump_version({"$inc": {"member_count": 1}}) == {"$inc": {"member_count": 1, VERSION_FIELD: 1}}
+    assert bump_version({"$set": {"a": 1}}) == {"$set": {"a": 1}, "$inc": {VERSION_FIELD: 1}}
+
+def test_version_filter():
+    assert version_filter(_ID, 0) == {"_id": _ID, VERSION_FIELD: {"$in": [0, None]}}
+    assert version_filter(_ID, 3) == {"_id": _ID, VERSION_FIELD: 3}